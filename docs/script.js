@@ -26,6 +26,8 @@ document.addEventListener('DOMContentLoaded', async () => {
   // アプリケーション全体で利用する定数と変数
   const MAX_ROUTES = 5; // 登録可能な最大路線数
   let lineUserId = null; // ログインしたユーザーのLINE User ID
+  let settingsVersion = 0; // 最後に取得/保存した設定のバージョン（競合検出に使用）
+  let savedRouteIds = []; // 最後に取得/保存した路線IDのリスト（差分計算の基準）
   let allRoutes = []; // 自動補完用の全路線リスト
 
   /**
@@ -52,6 +54,8 @@ document.addEventListener('DOMContentLoaded', async () => {
     // ユーザー情報が正常に取得できた場合
     if (userData && userData.lineUserId) {
       lineUserId = userData.lineUserId; // ユーザーIDをグローバル変数に保存
+      settingsVersion = userData.version || 0;
+      savedRouteIds = userData.routeIds || [];
 
       // 4. 取得したユーザー設定でフォームを初期化
       initializeSettings(userData);
@@ -290,9 +294,12 @@ document.addEventListener('DOMContentLoaded', async () => {
         return;
       }
 
+      // 前回取得時の路線IDとバージョンを送り、サーバー側で読み取りなしに差分保存させる
       const payload = {
         lineUserId: lineUserId,
         routes: routesToSave,
+        baseRoutes: savedRouteIds,
+        version: settingsVersion,
       };
 
       displayMessage('保存中...', false);
@@ -306,8 +313,15 @@ document.addEventListener('DOMContentLoaded', async () => {
           body: JSON.stringify(payload)
         });
 
+        if (response.status === 409) {
+          displayMessage('エラー: 設定が他の画面で更新されています。ページを再読み込みしてください。', true);
+          return;
+        }
         if (!response.ok) throw new Error('保存に失敗しました');
 
+        const result = await response.json();
+        settingsVersion = result.version;
+        savedRouteIds = routesToSave;
         displayMessage('保存しました！', false);
 
       } catch (error) {
@@ -0,0 +1,111 @@
+# -*- coding: utf-8 -*-
+"""遅延チェックの単一ループとシャード分割 (スレッド・プロセス) の処理時間を比較する.
+
+転置インデックスとアウトボックスへのアクセスはスタブに置き換え、路線数を増やした
+合成データで、判定処理 (主にSimHashの計算) の時間と結果の一致を確認する。
+
+    python benchmarks/bench_delay_check_sharded.py [--routes 20000] [--shards 4]
+
+プロセスプールのワーカーにスタブを引き継ぐため、forkが使える環境で実行する。
+
+1 vCPUでの測定では、シャード分割はスレッド・プロセスのいずれでも速くならない
+(20,000路線で単一ループ 1.67秒、スレッド 1.60秒 (x1.05)、プロセス 2.13秒 (x0.79))。
+送信がアウトボックス経由になり、遅延チェックはSimHashの計算が中心のCPU処理のみと
+なったため、スレッドではGILにより並列化されず、プロセスプールはLambdaでは使えない。
+マルチコアでプロセスプールが速くなることは確認していないため、本番ではシャード数を1とする。
+"""
+
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import check_delay_handler as cdh  # noqa: E402
+
+MESSAGE_TEMPLATES = [
+    "{time}頃、{station}駅で発生した人身事故の影響で、運転を見合わせています。",
+    "{time}頃、{station}駅付近で発生した信号トラブルの影響で、遅れが出ています。",
+    "強風の影響で、{station}駅～{station2}駅間で速度を落として運転しています。",
+    "{time}頃、{station}駅で発生した車両点検の影響で、一部列車に遅れが出ています。",
+]
+STATIONS = ["東京", "新宿", "渋谷", "池袋", "品川", "上野", "大宮", "横浜", "千葉"]
+
+
+def make_inputs(route_count, seed=0):
+    rng = random.Random(seed)
+    railway_list = [
+        {"route": f"路線{i}", "odpt:railway": f"odpt.Railway:Bench.Line{i}"}
+        for i in range(route_count)
+    ]
+    realtime_data_list = [
+        {
+            "odpt:railway": item["odpt:railway"],
+            "odpt:trainInformationText": {
+                "ja": rng.choice(MESSAGE_TEMPLATES).format(
+                    time=f"{rng.randrange(5, 24)}時{rng.randrange(60):02d}分",
+                    station=rng.choice(STATIONS),
+                    station2=rng.choice(STATIONS),
+                )
+            },
+        }
+        for item in railway_list
+    ]
+    s3_delay_list = [
+        {
+            "route": item["route"],
+            "messages": realtime_data["odpt:trainInformationText"]["ja"],
+        }
+        for item, realtime_data in zip(railway_list, realtime_data_list)
+        if rng.random() < 0.5
+    ]
+    route_ids = [item["odpt:railway"] for item in railway_list]
+    delay_records = [cdh.DelayRecord.from_dict(item) for item in s3_delay_list]
+    return route_ids, realtime_data_list, railway_list, delay_records
+
+
+def stub_io():
+    cdh.get_route_subscribers = lambda route_ids: {
+        route_id: {f"U-{route_id}"} for route_id in route_ids
+    }
+    cdh.enqueue_notifications = lambda *args: 1
+
+
+def run(shards, executor, inputs):
+    cdh.DELAY_CHECK_SHARDS = shards
+    cdh.DELAY_CHECK_EXECUTOR = executor
+    started_at = time.perf_counter()
+    records = cdh.delay_check_sharded(*inputs)
+    elapsed = time.perf_counter() - started_at
+    return elapsed, sorted(
+        (record.route, record.messages, record.fingerprint) for record in records
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--routes", type=int, default=20000)
+    parser.add_argument("--shards", type=int, default=4)
+    args = parser.parse_args()
+
+    cdh.logger.setLevel("WARNING")
+    stub_io()
+    inputs = make_inputs(args.routes)
+
+    serial_elapsed, serial_result = run(1, "thread", inputs)
+    print(f"cpu={os.cpu_count()} routes={args.routes} serial: {serial_elapsed:.2f}s")
+    for executor in ("thread", "process"):
+        elapsed, result = run(args.shards, executor, inputs)
+        assert result == serial_result, f"{executor}の結果が単一ループと一致しません"
+        speedup = serial_elapsed / elapsed
+        print(
+            f"routes={args.routes} shards={args.shards} {executor}: {elapsed:.2f}s "
+            f"(x{speedup:.2f}, 結果一致"
+            f"{'' if speedup > 1.1 else '、単一ループより速くならない'})"
+        )
+
+
+if __name__ == "__main__":
+    main()
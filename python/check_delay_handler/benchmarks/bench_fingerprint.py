@@ -0,0 +1,75 @@
+# -*- coding: utf-8 -*-
+"""運行情報の本文のSimHashの計算時間と、コーパスの組ごとのハミング距離を出力する.
+
+コーパスは、日時・数字のみが異なる再発行 (same_event) と、通知すべき状態の変化
+(changed_event) を組にした tests/data/delay_message_corpus.json を使用する。
+組の一方を通知済み、もう一方を今回の本文として、is_duplicate_messageと本文の完全一致の
+それぞれで抑止される送信の件数も出力する。same_eventでは抑止されるほど重複送信が減り、
+changed_eventで抑止された件数は通知の漏れとなる。
+
+    python benchmarks/bench_fingerprint.py [--repeat 2000]
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+
+FUNCTION_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CORPUS_PATH = os.path.join(FUNCTION_DIR, "tests", "data", "delay_message_corpus.json")
+sys.path.insert(0, FUNCTION_DIR)
+
+import check_delay_handler as cdh  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=2000)
+    args = parser.parse_args()
+
+    with open(CORPUS_PATH, encoding="utf-8") as f:
+        corpus = json.load(f)
+
+    print(f"重複とみなす距離の閾値: {cdh.DUPLICATE_MAX_HAMMING_DISTANCE}")
+    for kind in ("same_event", "changed_event"):
+        for message, other_message in corpus[kind]:
+            distance = (
+                cdh.compute_fingerprint(message)
+                ^ cdh.compute_fingerprint(other_message)
+            ).bit_count()
+            print(f"{kind:13s} 距離={distance:2d}  {other_message[:40]}")
+
+    print("抑止される送信の件数 (SimHash / 完全一致 / 組の数)")
+    for kind in ("same_event", "changed_event"):
+        simhash_suppressed = exact_suppressed = 0
+        for notified_message, message in corpus[kind]:
+            simhash_suppressed += cdh.is_duplicate_message(
+                cdh.compute_fingerprint(message),
+                cdh.compute_fingerprint(notified_message),
+            )
+            exact_suppressed += message == notified_message
+        print(
+            f"{kind:13s} {simhash_suppressed:3d} / {exact_suppressed:3d}"
+            f" / {len(corpus[kind]):3d}"
+        )
+
+    messages = [
+        message
+        for kind in ("same_event", "changed_event")
+        for pair in corpus[kind]
+        for message in pair
+    ]
+    started = time.perf_counter()
+    for _ in range(args.repeat):
+        for message in messages:
+            cdh.compute_fingerprint(message)
+    elapsed = time.perf_counter() - started
+    print(
+        f"compute_fingerprint: {elapsed / (args.repeat * len(messages)) * 1e6:.1f}"
+        f" µs/件 ({len(messages)} 件 x {args.repeat} 回)"
+    )
+
+
+if __name__ == "__main__":
+    main()
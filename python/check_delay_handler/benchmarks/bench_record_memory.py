@@ -0,0 +1,127 @@
+# -*- coding: utf-8 -*-
+"""運行情報APIのレコードと通知済みの遅延情報を、辞書のまま保持した場合と__slots__付きの
+レコード型に射影した場合のメモリ使用量を、tracemallocで比較する.
+
+    python benchmarks/bench_record_memory.py [--records 100000]
+
+保持量 (retained) は射影後に残るオブジェクトの合計、ピーク (peak) はJSONのデコードを含む
+処理中の最大値を示す。
+"""
+
+import argparse
+import gc
+import json
+import os
+import sys
+import tracemalloc
+
+FUNCTION_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RAILWAY_LIST_PATH = os.path.join(os.path.dirname(FUNCTION_DIR), "railway_list.json")
+sys.path.insert(0, FUNCTION_DIR)
+
+import check_delay_handler as cdh  # noqa: E402
+
+MESSAGES = [
+    "平常どおり運転しています。",
+    "信号トラブルの影響で、中央線快速電車に遅れが出ています。",
+    "強風の影響で、京葉線は東京～蘇我駅間で運転を見合わせています。",
+]
+
+
+def make_realtime_data(index, railway_id):
+    """運行情報APIのレコードと同じ項目を持つ辞書を生成する (1割を遅延とする)."""
+    message = MESSAGES[0] if index % 10 else MESSAGES[1 + index % 2]
+    return {
+        "@context": "http://vocab.odpt.org/context_odpt.jsonld",
+        "@id": f"urn:ucode:_00001C00000000000001000003{index:06d}",
+        "@type": "odpt:TrainInformation",
+        "dc:date": "2026-10-19T09:00:00+09:00",
+        "odpt:operator": "odpt.Operator:JR-East",
+        "odpt:railway": railway_id,
+        "owl:sameAs": f"odpt.TrainInformation:{railway_id}",
+        "odpt:timeOfOrigin": "2026-10-19T08:55:00+09:00",
+        "odpt:trainInformationText": {"ja": message, "en": "Service is running."},
+        "odpt:trainInformationStatus": {"ja": "平常", "en": "Normal"},
+    }
+
+
+def measure(function):
+    """関数の実行中のピークと、戻り値を保持したままのメモリ使用量 (MiB) を返す."""
+    gc.collect()
+    tracemalloc.start()
+    result = function()  # noqa: F841 (計測が終わるまで戻り値を保持する)
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return current / 2**20, peak / 2**20
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--records", type=int, default=100_000)
+    args = parser.parse_args()
+
+    with open(RAILWAY_LIST_PATH, encoding="utf-8") as f:
+        railway_list = json.load(f)
+    catalog = cdh.RailwayCatalog(railway_list)
+
+    # 運行情報APIのレコード (APIのレスポンスと同じ項目を持つ辞書)
+    realtime_body = json.dumps(
+        [
+            make_realtime_data(
+                index, railway_list[index % len(railway_list)]["odpt:railway"]
+            )
+            for index in range(args.records)
+        ],
+        ensure_ascii=False,
+    )
+
+    def keep_realtime_dicts():
+        return json.loads(realtime_body)
+
+    def project_realtime_data():
+        realtime_data_list = json.loads(realtime_body)
+        return [
+            cdh.TrainInformation(
+                catalog.intern(realtime_data["odpt:railway"]),
+                cdh._get_information_text(realtime_data),
+            )
+            for realtime_data in realtime_data_list
+        ]
+
+    for label, function in (
+        ("運行情報 (辞書)", keep_realtime_dicts),
+        ("運行情報 (TrainInformation)", project_realtime_data),
+    ):
+        retained, peak = measure(function)
+        print(f"{label:28s} retained {retained:7.1f} MiB  peak {peak:7.1f} MiB")
+
+    # 通知済みの遅延情報 (delay-messages.json)
+    delay_body = json.dumps(
+        [
+            {
+                "route": railway_list[index % len(railway_list)]["route"],
+                "messages": MESSAGES[1],
+                "fingerprint": "f4a0746023b486b6",
+            }
+            for index in range(args.records)
+        ],
+        ensure_ascii=False,
+    )
+
+    def project_delay_records():
+        return [
+            cdh.DelayRecord.from_dict(delay_message)
+            for delay_message in json.loads(delay_body)
+        ]
+
+    for label, function in (
+        ("通知済み (辞書)", lambda: json.loads(delay_body)),
+        ("通知済み (DelayRecord)", project_delay_records),
+    ):
+        retained, peak = measure(function)
+        print(f"{label:28s} retained {retained:7.1f} MiB  peak {peak:7.1f} MiB")
+    print(f"レコード数: {args.records}")
+
+
+if __name__ == "__main__":
+    main()
@@ -5,22 +5,86 @@ EventBridgeからの定期的なトリガーを受け取り、対象の路線情
 遅延が発生している場合は、SNSにメッセージを発行してユーザーに通知します。
 """
 
+import bisect
+import functools
+import hashlib
 import json
 import logging
+import math
 import os
-
-import boto3
-import requests
-from boto3.dynamodb.conditions import Key
+import random
+import re
+import sys
+import threading
+import time
+import unicodedata
+import uuid
+from collections import Counter
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, as_completed, wait
+
+# boto3・requestsはインポートに時間がかかるため、初回使用時にインポートする
 from botocore.exceptions import ClientError
 
+import delay_history
+
 # --- ログ設定 ---
 # ログレベルを環境変数から取得、なければINFO
 LOG_LEVEL = os.environ.get("LOG_LEVEL", "INFO").upper()
+# ログの出力形式 ("JSON" の場合は構造化ログ、それ以外はLambdaランタイムの既定の形式)
+LOG_FORMAT = os.environ.get("LOG_FORMAT", "JSON").upper()
+# 送信先ユーザーごとなど、件数の多いイベントのログを出力する割合 (0.0〜1.0)
+LOG_SAMPLE_RATE = float(os.environ.get("LOG_SAMPLE_RATE", "0.01"))
 # ルートロガーを取得し、レベルを設定
 logger = logging.getLogger()
 logger.setLevel(LOG_LEVEL)
 
+# LogRecordの標準属性 (これ以外の属性はextra=で渡された値として出力する)
+_LOG_RECORD_ATTRIBUTES = set(
+    vars(logging.LogRecord("", logging.INFO, "", 0, "", None, None))
+) | {"message", "asctime"}
+
+
+class JsonFormatter(logging.Formatter):
+    """ログレコードを1行のJSONに整形するフォーマッタ.
+
+    メッセージの組み立て (%形式の引数の展開) は出力時にのみ行われる。
+    extra=で渡した値は、JSONのトップレベルのキーとして出力する。
+    """
+
+    def format(self, record):
+        log_entry = {
+            "timestamp": self.formatTime(record, "%Y-%m-%dT%H:%M:%S%z"),
+            "level": record.levelname,
+            "message": record.getMessage(),
+            "logger": record.name,
+            "location": f"{record.funcName}:{record.lineno}",
+        }
+        for key, value in record.__dict__.items():
+            if key not in _LOG_RECORD_ATTRIBUTES and not key.startswith("_"):
+                log_entry[key] = value
+        if record.exc_info:
+            log_entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(log_entry, ensure_ascii=False, default=str)
+
+
+if LOG_FORMAT == "JSON":
+    if not logger.handlers:
+        logger.addHandler(logging.StreamHandler())
+    for handler in logger.handlers:
+        handler.setFormatter(JsonFormatter())
+
+
+def log_sampled(level, msg, *args, extra=None, **kwargs):
+    """件数の多いイベントのログを、LOG_SAMPLE_RATEの割合でのみ出力する.
+
+    出力したログには、集計時に件数を復元できるよう"sample_rate"を付与する。
+    """
+    if not logger.isEnabledFor(level) or random.random() >= LOG_SAMPLE_RATE:
+        return
+    sampled_extra = {**(extra or {}), "sample_rate": LOG_SAMPLE_RATE}
+    logger.log(level, msg, *args, extra=sampled_extra, stacklevel=2, **kwargs)
+
+
 # --- AWSリソース設定 ---
 # 環境変数から設定値を取得
 LINE_CHANNEL_ID = os.environ.get("LINE_CHANNEL_ID")
@@ -29,6 +93,8 @@ ODPT_ACCESS_TOKEN_PARAM_NAME = os.environ.get("ODPT_ACCESS_TOKEN_PARAM_NAME")
 CHALLENGE_ACCESS_TOKEN_PARAM_NAME = os.environ.get("CHALLENGE_ACCESS_TOKEN_PARAM_NAME")
 S3_BUCKET_NAME = os.environ.get("S3_OUTPUT_BUCKET")
 USER_TABLE_NAME = os.environ.get("USER_TABLE_NAME")
+# 路線ID -> 登録ユーザーIDのセットを保持する転置インデックスのテーブル
+ROUTE_SUBSCRIBERS_TABLE_NAME = os.environ.get("ROUTE_SUBSCRIBERS_TABLE_NAME")
 NG_WORD = os.environ.get("NG_WORD", "")
 # APIリクエストのタイムアウト設定（秒）
 # connect: サーバーへの接続確立の最大待機時間（ダウン時に早期に判断するため非常に短く設定）
@@ -36,30 +102,188 @@ NG_WORD = os.environ.get("NG_WORD", "")
 CONNECT_TIMEOUT = 2
 READ_TIMEOUT = int(os.environ.get("RESPONSE_TIMEOUT", "15"))
 
+# --- 運行情報APIのサーキットブレーカー設定 ---
+# 連続してこの回数失敗したエンドポイントは、一定時間呼び出しを停止する (サーキットを開く)
+CIRCUIT_FAILURE_THRESHOLD = int(os.environ.get("CIRCUIT_FAILURE_THRESHOLD", "3"))
+# サーキットを開いてから、試験的な呼び出し (ハーフオープン) を許可するまでの秒数
+CIRCUIT_RESET_SECONDS = int(os.environ.get("CIRCUIT_RESET_SECONDS", "300"))
+CIRCUIT_STATE_CLOSED = "CLOSED"  # 通常どおり呼び出す
+CIRCUIT_STATE_OPEN = "OPEN"  # 呼び出しを停止中
+CIRCUIT_STATE_HALF_OPEN = "HALF_OPEN"  # 復旧確認のための試験的な呼び出し中
+# エンドポイントの状態をS3にも保存し、コールドスタートをまたいで引き継ぐか
+ENDPOINT_HEALTH_PERSIST = (
+    os.environ.get("ENDPOINT_HEALTH_PERSIST", "false").lower() == "true"
+)
+# 応答時間の指数移動平均 (EWMA) の平滑化係数
+LATENCY_EWMA_ALPHA = 0.2
+LATENCY_WINDOW_SIZE = 50  # p95の算出に使用する直近の応答時間の件数
+# 応答がp95を超えたときに同じリクエストをもう1本送信する (ヘッジリクエスト) か
+HEDGE_ENABLED = os.environ.get("HEDGE_ENABLED", "true").lower() == "true"
+HEDGE_MIN_SAMPLES = 10  # ヘッジリクエストの判定に必要な応答時間の最小件数
+
+# --- 並列処理設定 ---
+# 遅延チェックを分割するシャード数（1の場合は従来どおり単一ループで処理）
+# 送信はアウトボックス経由のため、遅延チェックはCPU処理のみとなり、1 vCPUのLambdaでは
+# シャード分割しても速くならない (benchmarks/bench_delay_check_sharded.py)。既定値は1とする
+DELAY_CHECK_SHARDS = int(os.environ.get("DELAY_CHECK_SHARDS", "1"))
+# シャードを処理するワーカーの種類 ("thread" または "process")
+# Lambda実行環境には/dev/shmが無くプロセスプールが使えないため、Lambda上では"thread"を使用する
+DELAY_CHECK_EXECUTOR = os.environ.get("DELAY_CHECK_EXECUTOR", "thread")
+# コンシステントハッシュのリング上に配置するシャードあたりの仮想ノード数
+HASH_RING_REPLICAS = 64
+
+# --- 遅延履歴設定 ---
+# 新たに通知した遅延情報を、S3の日付ごとのパーティション (delay-history/dt=YYYY-MM-DD/) に追記するか
+DELAY_HISTORY_ENABLED = (
+    os.environ.get("DELAY_HISTORY_ENABLED", "true").lower() == "true"
+)
+
+# --- 重複メッセージ判定設定 ---
+# 前回通知したメッセージとのSimHashのハミング距離がこの値以下なら、同じ内容とみなして通知しない
+DUPLICATE_MAX_HAMMING_DISTANCE = int(
+    os.environ.get("DUPLICATE_MAX_HAMMING_DISTANCE", "3")
+)
+SIMHASH_BITS = 64
+SIMHASH_SHINGLE_SIZE = 3  # SimHashの特徴量とする文字n-gramの長さ
+SIMHASH_COUNTER_WIDTH = (
+    16  # SimHashの桁ごとに1の数を数えるカウンタの幅 (bit、n-gram数の上限は65535)
+)
+# 正規化で除去する日時表現 (例: "10時30分頃", "10:30", "5月1日")
+MESSAGE_TIME_PATTERN = re.compile(
+    r"\d{1,2}月\d{1,2}日|\d{1,2}時(\d{1,2}分)?(頃|ごろ|現在)?|\d{1,2}:\d{2}(頃|ごろ|現在)?"
+)
+MESSAGE_DIGIT_PATTERN = re.compile(r"\d+")
+MESSAGE_SPACE_PATTERN = re.compile(r"\s+")
+
+# --- 通知アウトボックス設定 ---
+# 検知した通知は一旦アウトボックステーブルに保存し、配信処理で送信する
+OUTBOX_TABLE_NAME = os.environ.get("OUTBOX_TABLE_NAME")
+OUTBOX_MAX_ATTEMPTS = int(
+    os.environ.get("OUTBOX_MAX_ATTEMPTS", "5")
+)  # 最大送信試行回数
+OUTBOX_BASE_BACKOFF_SECONDS = int(os.environ.get("OUTBOX_BASE_BACKOFF_SECONDS", "30"))
+OUTBOX_DELIVERY_WORKERS = int(os.environ.get("OUTBOX_DELIVERY_WORKERS", "8"))
+OUTBOX_TTL_SECONDS = 7 * 24 * 60 * 60  # 配信済み・失敗した項目を保持する期間
+OUTBOX_PENDING_INDEX_NAME = "pending-index"
+# 残り実行時間がこの秒数を下回ったら、配信を打ち切り次回に持ち越す
+OUTBOX_DELIVERY_SAFETY_SECONDS = 10
+OUTBOX_STATUS_PENDING = "PENDING"
+OUTBOX_STATUS_DELIVERED = "DELIVERED"
+OUTBOX_STATUS_FAILED = "FAILED"
+# DynamoDBのTransactWriteItems/BatchGetItemで一度に扱える最大項目数
+DYNAMODB_TRANSACT_WRITE_LIMIT = 100
+DYNAMODB_BATCH_GET_LIMIT = 100
+
+# --- LINE送信結果 ---
+SEND_RESULT_SUCCESS = "success"  # 送信成功 (リトライキーによる重複送信の検知を含む)
+SEND_RESULT_RETRY = "retry"  # 一時的なエラーのため再送が必要
+SEND_RESULT_FAILED = "failed"  # 再送しても成功しないエラー
+
 # --- S3オブジェクトキー設定 ---
 USER_LIST_FILE_KEY = "user-list.json"  # 処理対象のユーザーリストが格納されたS3キー
 ROUTE_LIST_FILE_KEY = "route-list.json"  # 全ユーザーの登録路線リスト
 DELAY_MESSAGES_FILE_KEY = "delay-messages.json"  # 現在遅延中の路線リストのキャッシュ
+ENDPOINT_HEALTH_FILE_KEY = "endpoint-health.json"  # 運行情報APIエンドポイントの状態
 RAILWAY_LIST_FILE_NAME = "railway_list.json"
 
 # --- DynamoDBテーブルキー設定 ---
 PRIMARY_USER_KEY_NAME = "lineUserId"  # ユーザーIDを保持するパーティションキー
 ROUTE_COLUMN_NAME = "settingOrRoute"  # 路線情報を格納するソートキー
+ROUTE_INDEX_KEY_NAME = "routeId"  # 転置インデックスのパーティションキー
+SUBSCRIBERS_COLUMN_NAME = "subscribers"  # 登録ユーザーIDのセットを格納する属性
+USER_ROUTE_INDEX_NAME = "route-index"  # Usersテーブルの路線ID -> ユーザーIDのGSI
 
 # --- 外部API設定 ---
 LINE_PUSH_API_URL = "https://api.line.me/v2/bot/message/push"
+LINE_PUSH_TIMEOUT = (
+    CONNECT_TIMEOUT,
+    10,
+)  # LINE Push APIのタイムアウト (接続, 読み取り)
 # 運行情報APIのエンドポイントリスト
 LINE_API_URL = [
     "https://api.odpt.org/api/v4/odpt:TrainInformation",
     "https://api-challenge.odpt.org/api/v4/odpt:TrainInformation",
 ]
 
-# --- Boto3クライアントの初期化 ---
-# Lambdaの実行環境外で初期化することで、呼び出し間でクライアントを再利用し、パフォーマンスを向上させる
-ssm_client = boto3.client("ssm")
-s3_client = boto3.client("s3")
-dynamodb = boto3.resource("dynamodb")
-user_table = dynamodb.Table(USER_TABLE_NAME)
+# --- Boto3クライアント設定 ---
+# クライアントは初回使用時に生成し、ウォームスタート間で再利用する
+# (使用しない処理でのコールドスタート時間を短縮するため、モジュール読み込み時には生成しない)
+# 並列処理 (シャード・配信ワーカー) で同時に使用するため、接続プールを大きめに確保する
+AWS_MAX_POOL_CONNECTIONS = int(os.environ.get("AWS_MAX_POOL_CONNECTIONS", "32"))
+AWS_READ_TIMEOUT = 10
+AWS_MAX_ATTEMPTS = 3
+
+_aws_lock = threading.RLock()
+_aws_objects = {}
+
+
+def _get_aws_object(name, factory):
+    """生成済みのクライアント・リソースを返す。未生成の場合はfactoryで生成して登録する."""
+    aws_object = _aws_objects.get(name)
+    if aws_object is None:
+        # boto3のセッションはスレッドセーフではないため、生成処理はロック内で行う
+        with _aws_lock:
+            aws_object = _aws_objects.get(name)
+            if aws_object is None:
+                aws_object = factory()
+                _aws_objects[name] = aws_object
+    return aws_object
+
+
+def _get_boto_config():
+    """全クライアントで共有するbotocoreの設定を返す."""
+    from botocore.config import Config
+
+    return Config(
+        max_pool_connections=AWS_MAX_POOL_CONNECTIONS,
+        connect_timeout=CONNECT_TIMEOUT,
+        read_timeout=AWS_READ_TIMEOUT,
+        retries={"max_attempts": AWS_MAX_ATTEMPTS, "mode": "standard"},
+    )
+
+
+def get_aws_client(service_name):
+    """指定したサービスのBoto3クライアントを返す.
+
+    Args:
+        service_name (str): サービス名 (例: "s3", "ssm")。
+
+    Returns:
+        botocore.client.BaseClient: Boto3クライアント。
+    """
+
+    def create_client():
+        import boto3
+
+        return boto3.client(service_name, config=_get_boto_config())
+
+    return _get_aws_object(service_name, create_client)
+
+
+def get_dynamodb_resource():
+    """DynamoDBのBoto3リソースを返す."""
+
+    def create_resource():
+        import boto3
+
+        return boto3.resource("dynamodb", config=_get_boto_config())
+
+    return _get_aws_object("dynamodb-resource", create_resource)
+
+
+def get_dynamodb_client():
+    """DynamoDBリソースに紐づく低レベルクライアントを返す.
+
+    リソース経由のクライアントは属性値をPythonの型のまま扱え、スレッドセーフである。
+    """
+    return get_dynamodb_resource().meta.client
+
+
+def get_user_table():
+    """UsersテーブルのBoto3 Tableオブジェクトを返す."""
+    return _get_aws_object(
+        "user-table", lambda: get_dynamodb_resource().Table(USER_TABLE_NAME)
+    )
 
 
 def get_ssm_parameter(ssm_param_name):
@@ -76,32 +300,51 @@ def get_ssm_parameter(ssm_param_name):
     """
     logger.info(f"SSMからパラメータ'{ssm_param_name}'を取得します。")
     try:
-        response = ssm_client.get_parameter(Name=ssm_param_name, WithDecryption=True)
+        response = get_aws_client("ssm").get_parameter(
+            Name=ssm_param_name, WithDecryption=True
+        )
         return response["Parameter"]["Value"]
     except ClientError as e:
         logger.error(f"パラメータ {ssm_param_name} の取得に失敗しました: {e}")
         raise
 
 
-# --- グローバル変数の初期化 ---
-# 外部APIの認証情報をSSMから取得
-LINE_CHANNEL_SECRET = get_ssm_parameter(LINE_ACCESS_TOKEN_PARAM_NAME)
-api_url_token_pairs = []
+@functools.lru_cache(maxsize=None)
+def get_line_access_token():
+    """LINE Messaging APIのチャネルアクセストークンを取得する (初回のみSSMから読み込む).
 
-logger.info("運行情報APIのアクセストークンをSSMから読み込んでいます。")
-for api_url in LINE_API_URL:
-    if api_url == "https://api.odpt.org/api/v4/odpt:TrainInformation":
-        PARAM_NAME = ODPT_ACCESS_TOKEN_PARAM_NAME
-    elif api_url == "https://api-challenge.odpt.org/api/v4/odpt:TrainInformation":
-        PARAM_NAME = CHALLENGE_ACCESS_TOKEN_PARAM_NAME
-    else:
-        # 設定にないAPI URLが指定された場合はエラー
-        logger.error("無効なAPI URLが設定されています。", extra={"url": api_url})
-        raise ValueError("LINE_API_URLリストに無効なAPI URLが含まれています。")
+    Returns:
+        str: チャネルアクセストークン。
+    """
+    return get_ssm_parameter(LINE_ACCESS_TOKEN_PARAM_NAME)
 
-    API_TOKEN = get_ssm_parameter(PARAM_NAME)
-    api_url_token_pairs.append([api_url, API_TOKEN])
-logger.info("APIトークンの読み込みが完了しました。")
+
+@functools.lru_cache(maxsize=None)
+def get_api_url_token_pairs():
+    """運行情報APIのエンドポイントとアクセストークンの組を取得する (初回のみSSMから読み込む).
+
+    Returns:
+        list: [API URL, アクセストークン]のリスト。
+
+    Raises:
+        ValueError: LINE_API_URLに設定にないAPI URLが含まれている場合。
+    """
+    api_url_token_pairs = []
+
+    logger.info("運行情報APIのアクセストークンをSSMから読み込んでいます。")
+    for api_url in LINE_API_URL:
+        if api_url == "https://api.odpt.org/api/v4/odpt:TrainInformation":
+            param_name = ODPT_ACCESS_TOKEN_PARAM_NAME
+        elif api_url == "https://api-challenge.odpt.org/api/v4/odpt:TrainInformation":
+            param_name = CHALLENGE_ACCESS_TOKEN_PARAM_NAME
+        else:
+            # 設定にないAPI URLが指定された場合はエラー
+            logger.error("無効なAPI URLが設定されています。", extra={"url": api_url})
+            raise ValueError("LINE_API_URLリストに無効なAPI URLが含まれています。")
+
+        api_url_token_pairs.append([api_url, get_ssm_parameter(param_name)])
+    logger.info("APIトークンの読み込みが完了しました。")
+    return api_url_token_pairs
 
 
 def get_s3_object(bucket_name, key):
@@ -126,7 +369,9 @@ def get_s3_object(bucket_name, key):
         "S3オブジェクトを取得します。", extra={"bucket": bucket_name, "key": key}
     )
     try:
-        response_s3flagfile = s3_client.get_object(Bucket=bucket_name, Key=key)
+        response_s3flagfile = get_aws_client("s3").get_object(
+            Bucket=bucket_name, Key=key
+        )
         file_content_string = response_s3flagfile["Body"].read().decode("utf-8")
 
         # ファイルが空かチェック
@@ -182,21 +427,34 @@ def get_line_list(s3_lineuserid_list):
     Returns:
         list: 全ユーザーの路線情報を一意に集約したリスト。
     """
+    from boto3.dynamodb.conditions import Key
+
     if not s3_lineuserid_list:
         logger.info("ユーザーIDリストが空のため、DynamoDBのクエリをスキップします。")
         return []
 
     user_route_list = []
+    # フェーズ全体の集計 (ユーザーごとのログの代わりに最後にまとめて出力する)
+    phase_counts = Counter()
     logger.info(
-        f"DynamoDBから {len(s3_lineuserid_list)} 人のユーザーの路線情報取得を開始します。"
+        "DynamoDBから %d 人のユーザーの路線情報取得を開始します。",
+        len(s3_lineuserid_list),
     )
 
     for user_id in s3_lineuserid_list:
         try:
-            logger.debug(f"ユーザー'{user_id}'のデータをクエリしています...")
+            log_sampled(
+                logging.DEBUG,
+                "ユーザー'%s'のデータをクエリしています...",
+                user_id,
+                extra={"user_id": user_id},
+            )
             # パーティションキーでユーザーの項目を全て取得
-            response = user_table.query(
-                KeyConditionExpression=Key(PRIMARY_USER_KEY_NAME).eq(user_id)
+            # 路線の判定に使用するソートキーのみを取得し、項目の転送量を削減する
+            response = get_user_table().query(
+                KeyConditionExpression=Key(PRIMARY_USER_KEY_NAME).eq(user_id),
+                ProjectionExpression="#route",
+                ExpressionAttributeNames={"#route": ROUTE_COLUMN_NAME},
             )
 
             # ユーザー設定項目(#PROFILE#)を除外し、路線情報のみを抽出
@@ -207,20 +465,17 @@ def get_line_list(s3_lineuserid_list):
             ]
 
             if route_list:
-                logger.debug(
-                    f"ユーザー'{user_id}'の路線が {len(route_list)} 件見つかりました。",
-                    extra={"user_id": user_id, "route_count": len(route_list)},
-                )
+                phase_counts["users_with_routes"] += 1
                 user_route_list.extend(route_list)
             else:
-                logger.debug(
-                    f"ユーザー'{user_id}'の路線は見つかりませんでした。",
-                    extra={"user_id": user_id},
-                )
+                phase_counts["users_without_routes"] += 1
 
         except ClientError as e:
+            phase_counts["failed_users"] += 1
             logger.error(
-                f"ユーザー'{user_id}'のデータ取得に失敗しました: {e.response['Error']['Message']}",
+                "ユーザー'%s'のデータ取得に失敗しました: %s",
+                user_id,
+                e.response["Error"]["Message"],
                 extra={"user_id": user_id},
             )
             continue  # エラーが発生したユーザーはスキップして処理を続行
@@ -228,51 +483,308 @@ def get_line_list(s3_lineuserid_list):
     # 全ユーザーの路線リストから重複を排除
     unique_user_route_list = list(set(user_route_list))
     logger.info(
-        f"全ユーザーから合計 {len(unique_user_route_list)} 件のユニークな路線が見つかりました。",
-        extra={"unique_route_count": len(unique_user_route_list)},
+        "全ユーザーから合計 %d 件のユニークな路線が見つかりました。",
+        len(unique_user_route_list),
+        extra={"unique_route_count": len(unique_user_route_list), **phase_counts},
     )
-    logger.debug(f"ユニークな路線リスト: {unique_user_route_list}")
+    logger.debug("ユニークな路線リスト: %s", unique_user_route_list)
 
     return unique_user_route_list
 
 
+# --- 運行情報APIエンドポイントの状態 ---
+# ウォームスタート間で引き継ぐため、モジュールレベルで保持する
+_endpoint_health_lock = threading.Lock()
+_endpoint_health = {}
+_endpoint_health_loaded = False
+
+
+def _get_endpoint_health(url):
+    """エンドポイントの状態を返す。未登録の場合は初期状態で登録する (ロック取得中に呼び出す)."""
+    health = _endpoint_health.get(url)
+    if health is None:
+        health = {
+            "url": url,
+            "state": CIRCUIT_STATE_CLOSED,
+            "consecutiveFailures": 0,
+            "openedAt": None,
+            "latencyEwma": None,
+            "latencies": [],
+        }
+        _endpoint_health[url] = health
+    return health
+
+
+def load_endpoint_health():
+    """S3に保存されたエンドポイントの状態を読み込む (コールドスタート後の初回のみ).
+
+    ENDPOINT_HEALTH_PERSISTが無効な場合や、読み込みに失敗した場合は
+    モジュールレベルで保持している状態のみを使用する。
+    """
+    global _endpoint_health_loaded
+
+    if _endpoint_health_loaded or not ENDPOINT_HEALTH_PERSIST:
+        return
+    _endpoint_health_loaded = True
+
+    try:
+        saved_health_list = (
+            get_s3_object(S3_BUCKET_NAME, ENDPOINT_HEALTH_FILE_KEY) or []
+        )
+    except ClientError:
+        logger.warning(
+            "エンドポイントの状態を読み込めませんでした。初期状態から開始します。",
+            exc_info=True,
+        )
+        return
+
+    with _endpoint_health_lock:
+        for saved_health in saved_health_list:
+            url = saved_health.get("url")
+            if url and url not in _endpoint_health:
+                health = _get_endpoint_health(url)
+                health.update(saved_health)
+                health["latencies"] = health["latencies"][-LATENCY_WINDOW_SIZE:]
+
+
+def save_endpoint_health():
+    """エンドポイントの状態をS3に保存する (ENDPOINT_HEALTH_PERSISTが有効な場合のみ).
+
+    状態の保存は運行情報の取得に必須ではないため、失敗しても警告ログのみ出力する。
+    """
+    if not ENDPOINT_HEALTH_PERSIST:
+        return
+
+    with _endpoint_health_lock:
+        body = json.dumps(list(_endpoint_health.values()), ensure_ascii=False)
+    try:
+        get_aws_client("s3").put_object(
+            Bucket=S3_BUCKET_NAME, Key=ENDPOINT_HEALTH_FILE_KEY, Body=body
+        )
+    except ClientError:
+        logger.warning("エンドポイントの状態を保存できませんでした。", exc_info=True)
+
+
+def allow_endpoint_request(url):
+    """サーキットの状態から、エンドポイントを呼び出してよいか判定する.
+
+    サーキットが開いてからCIRCUIT_RESET_SECONDSが経過した場合は、ハーフオープンに
+    移行して1回だけ試験的な呼び出しを許可する。試験中の呼び出しが結果を記録しないまま
+    (タイムアウト等で) 中断した場合も、同じ時間の経過後に再度試験を許可する。
+
+    Args:
+        url (str): APIエンドポイントのURL。
+
+    Returns:
+        bool: 呼び出してよい場合はTrue。
+    """
+    with _endpoint_health_lock:
+        health = _get_endpoint_health(url)
+        if health["state"] == CIRCUIT_STATE_CLOSED:
+            return True
+
+        now = time.time()
+        if now - health["openedAt"] < CIRCUIT_RESET_SECONDS:
+            return False
+
+        health["state"] = CIRCUIT_STATE_HALF_OPEN
+        health["openedAt"] = now
+    logger.info(
+        "サーキットをハーフオープンに移行し、試験的に呼び出します。",
+        extra={"url": url},
+    )
+    return True
+
+
+def record_endpoint_latency(url, latency):
+    """成功した呼び出しの応答時間を記録し、EWMAとp95算出用の履歴を更新する."""
+    with _endpoint_health_lock:
+        health = _get_endpoint_health(url)
+        if health["latencyEwma"] is None:
+            health["latencyEwma"] = latency
+        else:
+            health["latencyEwma"] += LATENCY_EWMA_ALPHA * (
+                latency - health["latencyEwma"]
+            )
+        health["latencies"].append(round(latency, 3))
+        del health["latencies"][:-LATENCY_WINDOW_SIZE]
+
+
+def record_endpoint_success(url):
+    """エンドポイントの取得成功を記録し、サーキットを閉じる."""
+    with _endpoint_health_lock:
+        health = _get_endpoint_health(url)
+        previous_state = health["state"]
+        health["state"] = CIRCUIT_STATE_CLOSED
+        health["consecutiveFailures"] = 0
+        health["openedAt"] = None
+    if previous_state != CIRCUIT_STATE_CLOSED:
+        logger.info("エンドポイントの復旧を確認しました。", extra={"url": url})
+
+
+def record_endpoint_failure(url):
+    """エンドポイントの取得失敗を記録する.
+
+    連続失敗回数がCIRCUIT_FAILURE_THRESHOLDに達した場合、またはハーフオープンでの
+    試験的な呼び出しが失敗した場合はサーキットを開く。
+    """
+    with _endpoint_health_lock:
+        health = _get_endpoint_health(url)
+        health["consecutiveFailures"] += 1
+        should_open = (
+            health["state"] == CIRCUIT_STATE_HALF_OPEN
+            or health["consecutiveFailures"] >= CIRCUIT_FAILURE_THRESHOLD
+        )
+        if should_open:
+            health["state"] = CIRCUIT_STATE_OPEN
+            health["openedAt"] = time.time()
+        consecutive_failures = health["consecutiveFailures"]
+    if should_open:
+        logger.warning(
+            "エンドポイントのサーキットを開きます。%d 秒間呼び出しを停止します。",
+            CIRCUIT_RESET_SECONDS,
+            extra={"url": url, "consecutive_failures": consecutive_failures},
+        )
+
+
+def get_hedge_delay(url):
+    """ヘッジリクエストを送信するまでの待機時間 (直近の応答時間のp95) を返す.
+
+    ヘッジリクエストが無効な場合、サーキットが閉じていない場合、応答時間の履歴が
+    HEDGE_MIN_SAMPLES件に満たない場合はNoneを返す。
+    """
+    if not HEDGE_ENABLED:
+        return None
+    with _endpoint_health_lock:
+        health = _get_endpoint_health(url)
+        if health["state"] != CIRCUIT_STATE_CLOSED:
+            return None
+        latencies = sorted(health["latencies"])
+    if len(latencies) < HEDGE_MIN_SAMPLES:
+        return None
+    return latencies[math.ceil(len(latencies) * 0.95) - 1]
+
+
+def _request_train_information(url, token):
+    """運行情報APIを1回呼び出し、成功した場合は応答時間を記録してデータを返す."""
+    import requests
+
+    started_at = time.monotonic()
+    # 接続(connect)は2秒、読み取り(read)は環境変数の値(約15~30秒)でタイムアウト設定
+    response = requests.get(
+        url,
+        params={"acl:consumerKey": token},
+        timeout=(CONNECT_TIMEOUT, READ_TIMEOUT),
+    )
+    response.raise_for_status()
+    response_data = response.json()
+    record_endpoint_latency(url, time.monotonic() - started_at)
+    return response_data
+
+
+def fetch_train_information(url, token):
+    """運行情報APIを呼び出す。応答がp95を超えた場合はヘッジリクエストを送信する.
+
+    先に成功した方の結果を返し、遅い方のリクエストの完了は待たない。
+
+    Args:
+        url (str): APIエンドポイントのURL。
+        token (str): APIのアクセストークン。
+
+    Returns:
+        list: 運行情報のリスト。
+
+    Raises:
+        requests.exceptions.RequestException: すべてのリクエストが失敗した場合。
+    """
+    import requests
+
+    hedge_delay = get_hedge_delay(url)
+    executor = ThreadPoolExecutor(max_workers=2)
+    try:
+        futures = [executor.submit(_request_train_information, url, token)]
+        if hedge_delay is not None:
+            done, _ = wait(futures, timeout=hedge_delay, return_when=FIRST_COMPLETED)
+            if not done:
+                logger.info(
+                    "応答がp95 (%.2f 秒) を超えたため、ヘッジリクエストを送信します。",
+                    hedge_delay,
+                    extra={"url": url},
+                )
+                futures.append(executor.submit(_request_train_information, url, token))
+
+        last_error = None
+        for future in as_completed(futures):
+            try:
+                return future.result()
+            except requests.exceptions.RequestException as e:
+                last_error = e
+        raise last_error
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+
+
 def get_realtime_train_information():
     """リアルタイム運行情報APIを呼び出し、全路線の現在の運行状況を取得する.
 
+    各エンドポイントは並列に呼び出す。サーキットが開いているエンドポイントは
+    呼び出さずにスキップし、応答の遅いエンドポイントにはヘッジリクエストを送信する。
+
     Returns:
         list | None: 全路線の運行情報のリスト。APIリクエストに失敗した場合はNone。
     """
-    logger.info("全てのAPIエンドポイントからリアルタイム運行情報を取得します...")
-    realtime_data_list = []
-    success_count = 0
-    
-    for url, token in api_url_token_pairs:
-        logger.info(f"APIエンドポイントを呼び出します: {url}")
-        params = {"acl:consumerKey": token}
+    import requests
 
-        try:
-            # 接続(connect)は2秒、読み取り(read)は環境変数の値(約15~30秒)でタイムアウト設定
-            response = requests.get(url, params=params, timeout=(CONNECT_TIMEOUT, READ_TIMEOUT))
-            response.raise_for_status()
+    logger.info("全てのAPIエンドポイントからリアルタイム運行情報を取得します...")
+    load_endpoint_health()
 
-            response_data = response.json()
-            realtime_data_list.extend(response_data)
-            success_count += 1
-            logger.info(
-                f"URL {url} から {len(response_data)} 件のレコードを取得しました。",
-                extra={"url": url, "record_count": len(response_data)},
-            )
-        except requests.exceptions.RequestException as e:
-            # 片方のAPIが死んでいても、もう片方でデータが取れていれば「致命的なエラー」とはしない
+    api_url_token_pairs = []
+    for url, token in get_api_url_token_pairs():
+        if allow_endpoint_request(url):
+            api_url_token_pairs.append((url, token))
+        else:
             logger.warning(
-                f"APIエンドポイント {url} が応答しません。このソースはスキップします: {e}",
-                extra={"url": url}
+                "サーキットが開いているため、APIエンドポイント %s をスキップします。",
+                url,
+                extra={"url": url},
             )
 
-    if not realtime_data_list and success_count == 0:
+    # エンドポイントごとの取得結果 (結合時はLINE_API_URLの順序を保つ)
+    response_data_map = {}
+    if api_url_token_pairs:
+        with ThreadPoolExecutor(max_workers=len(api_url_token_pairs)) as executor:
+            futures = {
+                executor.submit(fetch_train_information, url, token): url
+                for url, token in api_url_token_pairs
+            }
+            for future in as_completed(futures):
+                url = futures[future]
+                try:
+                    response_data = future.result()
+                except requests.exceptions.RequestException as e:
+                    # 片方のAPIが死んでいても、もう片方でデータが取れていれば「致命的なエラー」とはしない
+                    record_endpoint_failure(url)
+                    logger.warning(
+                        f"APIエンドポイント {url} が応答しません。このソースはスキップします: {e}",
+                        extra={"url": url},
+                    )
+                    continue
+                record_endpoint_success(url)
+                response_data_map[url] = response_data
+                logger.info(
+                    f"URL {url} から {len(response_data)} 件のレコードを取得しました。",
+                    extra={"url": url, "record_count": len(response_data)},
+                )
+    save_endpoint_health()
+
+    if not response_data_map:
         logger.error("すべてのAPIエンドポイントからのデータ取得に失敗しました。")
         return None
 
+    realtime_data_list = []
+    for url, _ in get_api_url_token_pairs():
+        realtime_data_list.extend(response_data_map.get(url, []))
+
     logger.info(
         f"運行情報の取得が完了しました。合計 {len(realtime_data_list)} 件のレコードを処理します。",
         extra={"total_record_count": len(realtime_data_list)},
@@ -290,8 +802,9 @@ def create_snd_message(user_route, message):
     Returns:
         dict: LINE Flex MessageのJSONオブジェクト。
     """
-    logger.info(
-        f"路線'{user_route}'のFlex Messageを作成します。",
+    logger.debug(
+        "路線'%s'のFlex Messageを作成します。",
+        user_route,
         extra={"user_route": user_route},
     )
     # LINEのFlex Message Simulatorで作成したJSONをテンプレートとして使用
@@ -348,105 +861,951 @@ def create_snd_message(user_route, message):
     return message_object
 
 
-def snd_line_message(user_id, message_object):
+def snd_line_message(user_id, message_object, retry_key=None):
     """指定されたユーザーIDにLINE Pushメッセージを送信する.
 
+    リトライキーを指定した場合、同じキーでの再送はLINE側で重複として扱われ、
+    ユーザーに二重に届くことはない。
+
     Args:
         user_id (str): 送信先のLINEユーザーID ('U'から始まる文字列)。
         message_object (dict): 送信するメッセージオブジェクト (Flex Messageなど)。
+        retry_key (str | None): X-Line-Retry-Keyに指定するUUID。
 
     Returns:
-        bool: 送信が成功した場合はTrue、失敗した場合はFalse。
+        str: 送信結果 (SEND_RESULT_SUCCESS, SEND_RESULT_RETRY, SEND_RESULT_FAILED)。
     """
-    logger.info(
-        f"ユーザー'{user_id}'にLINEメッセージを送信します...",
+    import requests
+
+    log_sampled(
+        logging.INFO,
+        "ユーザー'%s'にLINEメッセージを送信します...",
+        user_id,
         extra={"user_id": user_id},
     )
 
     headers = {
         "Content-Type": "application/json",
-        "Authorization": f"Bearer {LINE_CHANNEL_SECRET}",
+        "Authorization": f"Bearer {get_line_access_token()}",
     }
+    if retry_key:
+        headers["X-Line-Retry-Key"] = retry_key
 
     # LINE Push APIのリクエストボディを作成
     payload = {"to": user_id, "messages": [message_object]}
 
     try:
         response = requests.post(
-            LINE_PUSH_API_URL, headers=headers, data=json.dumps(payload)
+            LINE_PUSH_API_URL,
+            headers=headers,
+            data=json.dumps(payload),
+            timeout=LINE_PUSH_TIMEOUT,
+        )
+    except requests.exceptions.RequestException:
+        logger.warning(
+            "LINEへの接続に失敗しました。再送対象とします。",
+            extra={"user_id": user_id},
+            exc_info=True,
         )
-        response.raise_for_status()  # HTTPエラーがあれば例外を発生させる
+        return SEND_RESULT_RETRY
 
-        logger.info(
+    # 409はリトライキーが受理済み (前回の送信が成功済み) であることを示す
+    if response.ok or (retry_key and response.status_code == 409):
+        log_sampled(
+            logging.INFO,
             "メッセージの送信に成功しました。",
             extra={"user_id": user_id, "status_code": response.status_code},
         )
-        return True
+        return SEND_RESULT_SUCCESS
 
-    except requests.exceptions.RequestException:
+    if response.status_code == 429 or response.status_code >= 500:
+        logger.warning(
+            "LINEへのメッセージ送信が一時的に失敗しました。再送対象とします。",
+            extra={"user_id": user_id, "status_code": response.status_code},
+        )
+        return SEND_RESULT_RETRY
+
+    logger.error(
+        "LINEへのメッセージ送信に失敗しました。",
+        extra={
+            "user_id": user_id,
+            "status_code": response.status_code,
+            "response_body": response.text,
+        },
+    )
+    return SEND_RESULT_FAILED
+
+
+def query_route_users(route_id):
+    """UsersテーブルのGSI (route-index) から、路線の登録ユーザーIDを取得する.
+
+    Args:
+        route_id (str): 鉄道ID。
+
+    Returns:
+        set: 登録ユーザーIDのセット。
+    """
+    user_ids = set()
+    paginator = get_dynamodb_client().get_paginator("query")
+    for page in paginator.paginate(
+        TableName=USER_TABLE_NAME,
+        IndexName=USER_ROUTE_INDEX_NAME,
+        KeyConditionExpression="#route = :route",
+        ExpressionAttributeNames={"#route": ROUTE_COLUMN_NAME},
+        ExpressionAttributeValues={":route": route_id},
+    ):
+        user_ids.update(item[PRIMARY_USER_KEY_NAME] for item in page.get("Items", []))
+    return user_ids
+
+
+def get_route_subscribers(route_ids):
+    """転置インデックスから、複数路線の登録ユーザーIDをまとめて取得する.
+
+    転置インデックスに項目の無い路線 (インデックスの構築前に登録された路線など) は、
+    UsersテーブルのGSIから登録ユーザーを取得する。登録ユーザーが全員解除した路線は、
+    属性の無い項目として残るため、GSIは参照しない。
+
+    Args:
+        route_ids (list): 鉄道IDのリスト。
+
+    Returns:
+        dict: 鉄道ID -> 登録ユーザーIDのセット。登録ユーザーのいない路線は含まれない。
+    """
+    subscribers_map = {}
+    indexed_route_ids = set()
+    client = get_dynamodb_client()
+    unique_route_ids = list(dict.fromkeys(route_ids))
+    for start in range(0, len(unique_route_ids), DYNAMODB_BATCH_GET_LIMIT):
+        request_items = {
+            ROUTE_SUBSCRIBERS_TABLE_NAME: {
+                "Keys": [
+                    {ROUTE_INDEX_KEY_NAME: route_id}
+                    for route_id in unique_route_ids[
+                        start : start + DYNAMODB_BATCH_GET_LIMIT
+                    ]
+                ]
+            }
+        }
+        attempt = 0
+        while request_items:
+            response = client.batch_get_item(RequestItems=request_items)
+            for item in response.get("Responses", {}).get(
+                ROUTE_SUBSCRIBERS_TABLE_NAME, []
+            ):
+                indexed_route_ids.add(item[ROUTE_INDEX_KEY_NAME])
+                subscribers = item.get(SUBSCRIBERS_COLUMN_NAME)
+                if subscribers:
+                    subscribers_map[item[ROUTE_INDEX_KEY_NAME]] = set(subscribers)
+            request_items = response.get("UnprocessedKeys") or {}
+            if request_items:
+                attempt += 1
+                time.sleep(min(0.05 * 2**attempt, 1))
+
+    unindexed_route_ids = [
+        route_id for route_id in unique_route_ids if route_id not in indexed_route_ids
+    ]
+    if unindexed_route_ids:
+        logger.warning(
+            "転置インデックスに項目の無い路線があります。UsersテーブルのGSIから取得します。",
+            extra={"route_ids": unindexed_route_ids},
+        )
+        for route_id in unindexed_route_ids:
+            user_ids = query_route_users(route_id)
+            if user_ids:
+                subscribers_map[route_id] = user_ids
+
+    logger.info(
+        f"{len(unique_route_ids)} 件の路線の登録ユーザーを転置インデックスから取得しました。",
+        extra={
+            "route_count": len(unique_route_ids),
+            "subscriber_count": sum(len(users) for users in subscribers_map.values()),
+        },
+    )
+    return subscribers_map
+
+
+def check_route_index(repair=False):
+    """Usersテーブルから転置インデックスを再構築し、保存されている内容との差分を検出する.
+
+    Args:
+        repair (bool): Trueの場合、差分のある路線の項目に不足しているユーザーを追加し、
+            余分なユーザーを削除する。
+
+    Returns:
+        dict: 差分のあった路線ごとの、インデックスに不足しているユーザーと余分なユーザー。
+    """
+    client = get_dynamodb_client()
+
+    # Usersテーブルの路線項目から、あるべき転置インデックスを構築
+    expected = {}
+    paginator = client.get_paginator("scan")
+    for page in paginator.paginate(
+        TableName=USER_TABLE_NAME,
+        ProjectionExpression="#user, #route",
+        ExpressionAttributeNames={
+            "#user": PRIMARY_USER_KEY_NAME,
+            "#route": ROUTE_COLUMN_NAME,
+        },
+    ):
+        for item in page.get("Items", []):
+            route_id = item[ROUTE_COLUMN_NAME]
+            if route_id.startswith("#PROFILE#"):
+                continue
+            expected.setdefault(route_id, set()).add(item[PRIMARY_USER_KEY_NAME])
+
+    # 保存されている転置インデックスを読み込む
+    actual = {}
+    for page in paginator.paginate(TableName=ROUTE_SUBSCRIBERS_TABLE_NAME):
+        for item in page.get("Items", []):
+            actual[item[ROUTE_INDEX_KEY_NAME]] = set(
+                item.get(SUBSCRIBERS_COLUMN_NAME) or []
+            )
+
+    differences = {}
+    for route_id in expected.keys() | actual.keys():
+        missing = expected.get(route_id, set()) - actual.get(route_id, set())
+        extra = actual.get(route_id, set()) - expected.get(route_id, set())
+        if missing or extra:
+            differences[route_id] = {
+                "missing": sorted(missing),
+                "extra": sorted(extra),
+            }
+
+    logger.info(
+        f"転置インデックスの整合性チェックが完了しました。差分のある路線: {len(differences)} 件",
+        extra={
+            "route_count": len(expected),
+            "mismatched_route_count": len(differences),
+            "repair": repair,
+        },
+    )
+
+    if repair:
+        # スキャン中にユーザー設定が保存されても、その変更を打ち消さないよう、
+        # 項目全体を上書きせず差分のユーザーのみをADD/DELETEで更新する
+        # (同じ属性へのADDとDELETEは1つの更新式にまとめられないため、別々に更新する)
+        for route_id, difference in differences.items():
+            for operation, user_ids in (
+                ("ADD", difference["missing"]),
+                ("DELETE", difference["extra"]),
+            ):
+                if not user_ids:
+                    continue
+                client.update_item(
+                    TableName=ROUTE_SUBSCRIBERS_TABLE_NAME,
+                    Key={ROUTE_INDEX_KEY_NAME: route_id},
+                    UpdateExpression=f"{operation} #subscribers :users",
+                    ExpressionAttributeNames={"#subscribers": SUBSCRIBERS_COLUMN_NAME},
+                    ExpressionAttributeValues={":users": set(user_ids)},
+                )
+        logger.info(f"{len(differences)} 件の路線の転置インデックスを修復しました。")
+
+    return differences
+
+
+def make_outbox_key(user_route_id, message):
+    """路線IDとメッセージ本文のハッシュから、アウトボックスのパーティションキーを生成する."""
+    message_hash = hashlib.sha256(message.encode("utf-8")).hexdigest()[:16]
+    return f"{user_route_id}#{message_hash}"
+
+
+def enqueue_notifications(user_route_id, user_route_name, message, user_list):
+    """通知対象ユーザーごとの配信項目をアウトボックスに保存する.
+
+    キーは(路線, メッセージのハッシュ, ユーザー)で一意になる。未配信の項目が既にある
+    場合 (検知結果の保存前に異常終了して再実行された場合など) は上書きせず、
+    送信回数とリトライキーを引き継ぐ。配信済み・失敗した項目は、同じ遅延が再発した
+    ものとして新しいリトライキーで未配信に戻す (前回のリトライキーのままでは、
+    LINE側で重複送信とみなされて届かないため)。
+
+    Args:
+        user_route_id (str): 鉄道ID。
+        user_route_name (str): 路線名。
+        message (str): 運行情報の本文。
+        user_list (list): 通知対象のLINEユーザーIDのリスト。
+
+    Returns:
+        int: 新たに保存した (未配信に戻した) 項目数。
+    """
+    outbox_key = make_outbox_key(user_route_id, message)
+    now = int(time.time())
+    items = [
+        {
+            "outboxKey": outbox_key,
+            PRIMARY_USER_KEY_NAME: user_id,
+            "routeId": user_route_id,
+            "routeName": user_route_name,
+            "message": message,
+            "retryKey": str(uuid.uuid4()),
+            "deliveryStatus": OUTBOX_STATUS_PENDING,
+            "attempts": 0,
+            "nextAttemptAt": now,
+            "createdAt": now,
+            "ttl": now + OUTBOX_TTL_SECONDS,
+        }
+        for user_id in user_list
+    ]
+
+    # シャードを並列処理する場合に備え、スレッドセーフな低レベルクライアントで書き込む
+    # (BatchWriteItemは条件を指定できないため、条件付きのトランザクションで書き込む)
+    client = get_dynamodb_client()
+    written_count = 0
+    for start in range(0, len(items), DYNAMODB_TRANSACT_WRITE_LIMIT):
+        remaining_items = items[start : start + DYNAMODB_TRANSACT_WRITE_LIMIT]
+        while remaining_items:
+            try:
+                client.transact_write_items(
+                    TransactItems=[
+                        {
+                            "Put": {
+                                "TableName": OUTBOX_TABLE_NAME,
+                                "Item": item,
+                                "ConditionExpression": (
+                                    "attribute_not_exists(outboxKey) "
+                                    "OR deliveryStatus <> :pending"
+                                ),
+                                "ExpressionAttributeValues": {
+                                    ":pending": OUTBOX_STATUS_PENDING
+                                },
+                            }
+                        }
+                        for item in remaining_items
+                    ]
+                )
+            except ClientError as e:
+                if e.response["Error"]["Code"] != "TransactionCanceledException":
+                    raise
+                # 未配信の項目が既にあるユーザーを除いて書き込み直す
+                reasons = e.response.get("CancellationReasons", [])
+                pending_indexes = {
+                    index
+                    for index, reason in enumerate(reasons)
+                    if reason.get("Code") == "ConditionalCheckFailed"
+                }
+                if not pending_indexes:
+                    raise
+                remaining_items = [
+                    item
+                    for index, item in enumerate(remaining_items)
+                    if index not in pending_indexes
+                ]
+                continue
+            written_count += len(remaining_items)
+            break
+
+    logger.info(
+        "路線'%s'の通知 %d 件をアウトボックスに保存しました。(既存の未配信: %d 件)",
+        user_route_name,
+        written_count,
+        len(items) - written_count,
+        extra={"user_route": user_route_name, "outbox_key": outbox_key},
+    )
+    return written_count
+
+
+def get_pending_outbox_items():
+    """送信予定時刻を過ぎた未配信のアウトボックス項目を取得する.
+
+    Returns:
+        list: 未配信の項目のリスト。
+    """
+    from boto3.dynamodb.conditions import Key
+
+    items = []
+    query_kwargs = {
+        "TableName": OUTBOX_TABLE_NAME,
+        "IndexName": OUTBOX_PENDING_INDEX_NAME,
+        "KeyConditionExpression": Key("deliveryStatus").eq(OUTBOX_STATUS_PENDING)
+        & Key("nextAttemptAt").lte(int(time.time())),
+    }
+    while True:
+        response = get_dynamodb_client().query(**query_kwargs)
+        items.extend(response.get("Items", []))
+        if "LastEvaluatedKey" not in response:
+            return items
+        query_kwargs["ExclusiveStartKey"] = response["LastEvaluatedKey"]
+
+
+def get_outbox_items(outbox_keys):
+    """指定した通知の未配信項目を、ベーステーブルから強い整合性の読み込みで取得する.
+
+    GSI (pending-index) は結果整合性のため、直前に保存した項目が反映されていない
+    場合がある。今回の実行で保存した通知は、この関数で取得して直接配信する。
+
+    Args:
+        outbox_keys (Iterable[str]): アウトボックスのパーティションキー。
+
+    Returns:
+        list: 送信予定時刻を過ぎた未配信の項目のリスト。
+    """
+    from boto3.dynamodb.conditions import Attr, Key
+
+    items = []
+    now = int(time.time())
+    for outbox_key in outbox_keys:
+        query_kwargs = {
+            "TableName": OUTBOX_TABLE_NAME,
+            "KeyConditionExpression": Key("outboxKey").eq(outbox_key),
+            "FilterExpression": Attr("deliveryStatus").eq(OUTBOX_STATUS_PENDING)
+            & Attr("nextAttemptAt").lte(now),
+            "ConsistentRead": True,
+        }
+        while True:
+            response = get_dynamodb_client().query(**query_kwargs)
+            items.extend(response.get("Items", []))
+            if "LastEvaluatedKey" not in response:
+                break
+            query_kwargs["ExclusiveStartKey"] = response["LastEvaluatedKey"]
+    return items
+
+
+def deliver_outbox_item(item, message_object):
+    """アウトボックスの1項目を送信し、結果に応じて項目の状態を更新する.
+
+    一時的なエラーの場合は指数バックオフで次回の送信予定時刻を設定し、
+    最大試行回数に達した場合は失敗として扱う。
+
+    Args:
+        item (dict): アウトボックスの項目。
+        message_object (dict): 送信するFlex Message。
+
+    Returns:
+        str: 送信後の項目の状態。
+    """
+    result = snd_line_message(
+        item[PRIMARY_USER_KEY_NAME], message_object, retry_key=item["retryKey"]
+    )
+
+    now = int(time.time())
+    attempts = int(item.get("attempts", 0)) + 1
+    if result == SEND_RESULT_SUCCESS:
+        status = OUTBOX_STATUS_DELIVERED
+        next_attempt_at = None
+    elif result == SEND_RESULT_RETRY and attempts < OUTBOX_MAX_ATTEMPTS:
+        status = OUTBOX_STATUS_PENDING
+        next_attempt_at = now + OUTBOX_BASE_BACKOFF_SECONDS * 2 ** (attempts - 1)
+    else:
+        status = OUTBOX_STATUS_FAILED
+        next_attempt_at = None
         logger.error(
-            "LINEへのメッセージ送信に失敗しました。",
-            extra={"user_id": user_id},
-            exc_info=True,
+            "通知の配信を断念しました。",
+            extra={
+                "user_id": item[PRIMARY_USER_KEY_NAME],
+                "outbox_key": item["outboxKey"],
+                "attempts": attempts,
+            },
+        )
+
+    update_expression = "SET deliveryStatus = :status, attempts = :attempts"
+    expression_values = {":status": status, ":attempts": attempts}
+    if status == OUTBOX_STATUS_PENDING:
+        update_expression += ", nextAttemptAt = :next_attempt_at"
+        expression_values[":next_attempt_at"] = next_attempt_at
+    else:
+        # 配信が完了した項目はGSIのソートキーを削除し、pending-indexから外す
+        # (未配信の項目のみを含むスパースインデックスとして、GSIへの書き込みを減らす)
+        update_expression += " REMOVE nextAttemptAt"
+
+    get_dynamodb_client().update_item(
+        TableName=OUTBOX_TABLE_NAME,
+        Key={
+            "outboxKey": item["outboxKey"],
+            PRIMARY_USER_KEY_NAME: item[PRIMARY_USER_KEY_NAME],
+        },
+        UpdateExpression=update_expression,
+        ExpressionAttributeValues=expression_values,
+    )
+    return status
+
+
+def deliver_outbox(context=None, outbox_keys=()):
+    """アウトボックスの未配信項目を並列に送信する.
+
+    今回の実行で保存した通知 (outbox_keys) はベーステーブルから直接取得し、
+    それ以外の再送待ちの項目はGSIから取得する。
+    Lambdaの残り実行時間が少なくなった場合は、新たな送信を打ち切って次回の
+    実行に持ち越す。
+
+    Args:
+        context (object | None): Lambdaの実行コンテキスト。残り時間の判定に使用する。
+        outbox_keys (Iterable[str]): 今回の実行で保存した通知のアウトボックスのキー。
+
+    Returns:
+        dict: 状態ごとの処理件数。
+    """
+    pending_items = get_outbox_items(outbox_keys)
+    fetched_keys = {
+        (item["outboxKey"], item[PRIMARY_USER_KEY_NAME]) for item in pending_items
+    }
+    pending_items.extend(
+        item
+        for item in get_pending_outbox_items()
+        if (item["outboxKey"], item[PRIMARY_USER_KEY_NAME]) not in fetched_keys
+    )
+    counts = {
+        OUTBOX_STATUS_DELIVERED: 0,
+        OUTBOX_STATUS_PENDING: 0,
+        OUTBOX_STATUS_FAILED: 0,
+        "deferred": 0,
+    }
+    if not pending_items:
+        logger.info("アウトボックスに未配信の通知はありません。")
+        return counts
+
+    logger.info(
+        f"アウトボックスの未配信通知 {len(pending_items)} 件の配信を開始します。",
+        extra={"pending_count": len(pending_items)},
+    )
+
+    # Flex Messageは宛先ごとではなく、通知 (アウトボックスのキー) ごとに1回だけ生成する
+    message_objects = {}
+    for item in pending_items:
+        if item["outboxKey"] not in message_objects:
+            message_objects[item["outboxKey"]] = create_snd_message(
+                item["routeName"], item["message"]
+            )
+
+    def has_time_left():
+        if context is None:
+            return True
+        remaining_ms = context.get_remaining_time_in_millis()
+        return remaining_ms > OUTBOX_DELIVERY_SAFETY_SECONDS * 1000
+
+    def deliver(item):
+        if not has_time_left():
+            return "deferred"
+        try:
+            return deliver_outbox_item(item, message_objects[item["outboxKey"]])
+        except ClientError:
+            # 状態を更新できなかった項目は未配信のまま残り、次回リトライキー付きで再送される
+            logger.error(
+                "アウトボックスの状態更新に失敗しました。",
+                extra={"outbox_key": item["outboxKey"]},
+                exc_info=True,
+            )
+            return OUTBOX_STATUS_PENDING
+
+    with ThreadPoolExecutor(max_workers=OUTBOX_DELIVERY_WORKERS) as executor:
+        for status in executor.map(deliver, pending_items):
+            counts[status] += 1
+
+    logger.info("アウトボックスの配信が完了しました。", extra={"counts": counts})
+    return counts
+
+
+# --- 遅延判定で使用するレコード型 ---
+# APIレスポンスやS3のJSONをそのまま保持せず、遅延判定で参照する項目のみを
+# __slots__付きのクラスに射影して、レコードあたりのメモリと辞書の生成コストを削減する
+
+
+class RailwayCatalog:
+    """railway_list.jsonの鉄道IDを、連番の整数コードに変換 (インターン) するカタログ.
+
+    遅延判定の索引には鉄道IDの文字列ではなく整数コードを使用する。
+    """
+
+    __slots__ = ("railway_ids", "route_names", "codes")
+
+    def __init__(self, railway_list):
+        """路線名と鉄道IDのマッピングからカタログを構築する.
+
+        Args:
+            railway_list (list): 路線名と鉄道IDのマッピング。
+        """
+        self.railway_ids = []
+        self.route_names = []
+        self.codes = {}
+        for item in railway_list:
+            railway_id = item["odpt:railway"]
+            if railway_id in self.codes:
+                # 同じ鉄道IDが複数ある場合は、従来どおり後のエントリの路線名を使用する
+                self.route_names[self.codes[railway_id]] = item["route"]
+                continue
+            self.codes[railway_id] = len(self.railway_ids)
+            self.railway_ids.append(railway_id)
+            self.route_names.append(item["route"])
+
+    def __len__(self):
+        return len(self.railway_ids)
+
+    def intern(self, railway_id):
+        """鉄道IDの整数コードを返す。カタログにない場合はNoneを返す."""
+        return self.codes.get(railway_id)
+
+    def route_name(self, code):
+        """整数コードに対応する路線名を返す."""
+        return self.route_names[code]
+
+
+class TrainInformation:
+    """リアルタイム運行情報APIのレコードのうち、遅延判定で使用する項目."""
+
+    __slots__ = ("railway", "message")
+
+    def __init__(self, railway, message):
+        self.railway = railway  # 鉄道IDの整数コード
+        self.message = message  # 運行情報の本文 (日本語)
+
+
+def _get_information_text(realtime_data):
+    """運行情報APIのレコードから、運行情報の本文 (日本語) を取り出す."""
+    info_text = realtime_data.get("odpt:trainInformationText", {})
+    if isinstance(info_text, dict):
+        message = info_text.get("ja", "")
+    else:
+        message = str(info_text) if info_text else ""
+    # 「平常どおり運転しています。」等の同じ本文は、1つの文字列オブジェクトを共有する
+    return sys.intern(message)
+
+
+class DelayRecord:
+    """delay-messages.jsonに保存する、路線ごとの通知済みの遅延情報."""
+
+    __slots__ = ("route", "messages", "fingerprint")
+
+    def __init__(self, route, messages, fingerprint):
+        self.route = route  # 路線名
+        self.messages = messages  # 通知した運行情報の本文
+        self.fingerprint = fingerprint  # 本文のSimHash (整数)
+
+    def __repr__(self):
+        return f"DelayRecord(route={self.route!r}, fingerprint={self.fingerprint:016x})"
+
+    @classmethod
+    def from_dict(cls, delay_message):
+        """delay-messages.jsonの要素から生成する (SimHashが未保存の旧形式にも対応する)."""
+        return cls(
+            delay_message.get("route"),
+            delay_message.get("messages", ""),
+            get_notified_fingerprint(delay_message),
+        )
+
+    def to_dict(self):
+        """delay-messages.jsonに保存する形式に変換する."""
+        return {
+            "route": self.route,
+            "messages": self.messages,
+            "fingerprint": format_fingerprint(self.fingerprint),
+        }
+
+
+def build_train_information_map(realtime_data_list, catalog):
+    """運行情報APIのレコードを射影し、鉄道IDの整数コードごとの索引を作成する.
+
+    同じ鉄道IDのレコードが複数ある場合は先頭のレコードを使用する。
+    カタログにない鉄道IDのレコードは遅延判定で参照されないため破棄する。
+
+    Args:
+        realtime_data_list (list): 全路線のリアルタイム運行情報。
+        catalog (RailwayCatalog): 鉄道IDのカタログ。
+
+    Returns:
+        dict: 鉄道IDの整数コードをキー、TrainInformationを値とする辞書。
+    """
+    train_information_map = {}
+    codes = catalog.codes
+    for realtime_data in realtime_data_list:
+        railway = codes.get(realtime_data.get("odpt:railway"))
+        if railway is None or railway in train_information_map:
+            continue
+        train_information_map[railway] = TrainInformation(
+            railway, _get_information_text(realtime_data)
+        )
+    return train_information_map
+
+
+def build_hash_ring(shard_count):
+    """シャード数に応じたコンシステントハッシュのリングを構築する.
+
+    Args:
+        shard_count (int): シャード数。
+
+    Returns:
+        tuple[list, list]: リング上のハッシュ値(昇順)と、対応するシャード番号のリスト。
+    """
+    ring = sorted(
+        (_hash_key(f"shard-{shard}#{replica}"), shard)
+        for shard in range(shard_count)
+        for replica in range(HASH_RING_REPLICAS)
+    )
+    return [point for point, _ in ring], [shard for _, shard in ring]
+
+
+def _hash_key(key):
+    """文字列をリング上の位置(64bit整数)に変換する."""
+    return int(hashlib.md5(key.encode("utf-8")).hexdigest()[:16], 16)
+
+
+def partition_routes(user_route_list, shard_count):
+    """鉄道IDのコンシステントハッシュにより、路線リストをシャードに分割する.
+
+    Args:
+        user_route_list (list): 処理対象の鉄道IDのリスト。
+        shard_count (int): シャード数。
+
+    Returns:
+        list[list]: シャードごとの鉄道IDのリスト。
+    """
+    ring_points, ring_shards = build_hash_ring(shard_count)
+    shards = [[] for _ in range(shard_count)]
+    for user_route_id in user_route_list:
+        index = bisect.bisect(ring_points, _hash_key(user_route_id)) % len(ring_points)
+        shards[ring_shards[index]].append(user_route_id)
+    return shards
+
+
+def delay_check_sharded(
+    user_route_list, realtime_data_list, railway_list, delay_records
+):
+    """路線をシャードに分割し、シャードごとの遅延チェックを並列実行して結果を統合する.
+
+    運行情報は、分割前に一度だけレコード型に射影する。
+    DELAY_CHECK_SHARDSが1以下の場合は、delay_checkをそのまま呼び出す。
+    シャード分割による高速化は1 vCPUでは得られず、マルチコアでも未確認のため、
+    本番では使用していない。
+
+    Args:
+        user_route_list (list): 処理対象の鉄道IDのリスト。
+        realtime_data_list (list): 全路線のリアルタイム運行情報。
+        railway_list (list): 路線名と鉄道IDのマッピング。
+        delay_records (list[DelayRecord]): 前回通知済みの遅延情報のリスト。
+
+    Returns:
+        list[DelayRecord]: 全シャードで新たに通知した遅延情報のリスト。
+    """
+    catalog = RailwayCatalog(railway_list)
+    train_information_map = build_train_information_map(realtime_data_list, catalog)
+
+    if DELAY_CHECK_SHARDS <= 1 or len(user_route_list) <= 1:
+        return delay_check(
+            user_route_list, train_information_map, catalog, delay_records
         )
-        return False
 
+    shards = [
+        shard
+        for shard in partition_routes(user_route_list, DELAY_CHECK_SHARDS)
+        if shard
+    ]
+    logger.info(
+        f"{len(user_route_list)} 件の路線を {len(shards)} 個のシャードに分割して処理します。",
+        extra={
+            "shard_count": len(shards),
+            "shard_sizes": [len(shard) for shard in shards],
+            "executor": DELAY_CHECK_EXECUTOR,
+        },
+    )
+
+    if DELAY_CHECK_EXECUTOR == "process":
+        # プロセスプールはローカル実行専用のため、使用する場合のみインポートする
+        from concurrent.futures import ProcessPoolExecutor
+
+        executor_class = ProcessPoolExecutor
+    else:
+        executor_class = ThreadPoolExecutor
+    new_delay_records = []
+    with executor_class(max_workers=len(shards)) as executor:
+        futures = []
+        for shard in shards:
+            # ワーカーへの受け渡しを減らすため、シャードに関係する運行情報のみを渡す
+            shard_train_information_map = {}
+            for user_route_id in shard:
+                railway = catalog.intern(user_route_id)
+                if railway in train_information_map:
+                    shard_train_information_map[railway] = train_information_map[
+                        railway
+                    ]
+            futures.append(
+                executor.submit(
+                    delay_check,
+                    shard,
+                    shard_train_information_map,
+                    catalog,
+                    delay_records,
+                )
+            )
+
+        # シャードの順序で結果を統合し、delay-messages.jsonの内容を決定的にする
+        for future in futures:
+            new_delay_records.extend(future.result())
+
+    return new_delay_records
+
+
+def normalize_message(message):
+    """運行情報の本文から、再発行時に変わりやすい日時・数字・空白を取り除く.
+
+    Args:
+        message (str): 運行情報の本文。
+
+    Returns:
+        str: 正規化した本文。
+    """
+    # 全角の数字・記号を半角に揃えてから、日時表現と数字を除去する
+    normalized = unicodedata.normalize("NFKC", message)
+    normalized = MESSAGE_TIME_PATTERN.sub("", normalized)
+    normalized = MESSAGE_DIGIT_PATTERN.sub("0", normalized)
+    return MESSAGE_SPACE_PATTERN.sub("", normalized)
+
+
+@functools.lru_cache(maxsize=1)
+def get_simhash_weight_tables():
+    """ハッシュの各バイトの値から、桁ごとのカウンタに加算する重みへの変換表を作成する.
+
+    重みは、SimHashの桁ごとにSIMHASH_COUNTER_WIDTH bitのカウンタを並べた1つの整数で、
+    その桁が1の場合にカウンタが1になる。
+
+    Returns:
+        list[list[int]]: ハッシュのバイト位置 (先頭から) ごとの、バイト値 -> 重みの変換表。
+    """
+    byte_count = SIMHASH_BITS // 8
+    tables = []
+    for position in range(byte_count):
+        # 先頭のバイトほど上位の桁に対応する (ハッシュはビッグエンディアンで整数にする)
+        lowest_bit = 8 * (byte_count - 1 - position)
+        tables.append(
+            [
+                sum(
+                    ((value >> i) & 1) << ((lowest_bit + i) * SIMHASH_COUNTER_WIDTH)
+                    for i in range(8)
+                )
+                for value in range(256)
+            ]
+        )
+    return tables
+
+
+def compute_fingerprint(message):
+    """正規化した本文の文字n-gramから、64bitのSimHashを計算する.
+
+    Args:
+        message (str): 運行情報の本文。
+
+    Returns:
+        int: SimHashの値。
+    """
+    normalized = normalize_message(message)
+    if len(normalized) <= SIMHASH_SHINGLE_SIZE:
+        shingles = [normalized]
+    else:
+        shingles = [
+            normalized[i : i + SIMHASH_SHINGLE_SIZE]
+            for i in range(len(normalized) - SIMHASH_SHINGLE_SIZE + 1)
+        ]
+
+    # 各n-gramのハッシュの桁ごとの1の数を、桁ごとのカウンタを並べた1つの整数に加算し、
+    # 1が過半数の桁を1とする
+    weight_tables = get_simhash_weight_tables()
+    weights = 0
+    for shingle in shingles:
+        digest = hashlib.blake2b(shingle.encode("utf-8"), digest_size=8).digest()
+        weights += sum(map(list.__getitem__, weight_tables, digest))
+
+    threshold = len(shingles) / 2
+    counter_mask = (1 << SIMHASH_COUNTER_WIDTH) - 1
+    fingerprint = 0
+    for bit in range(SIMHASH_BITS):
+        if (weights >> (bit * SIMHASH_COUNTER_WIDTH)) & counter_mask > threshold:
+            fingerprint |= 1 << bit
+    return fingerprint
+
+
+def format_fingerprint(fingerprint):
+    """SimHashをdelay-messages.jsonに保存する16桁の16進文字列に変換する."""
+    return f"{fingerprint:016x}"
+
+
+def get_notified_fingerprint(delay_message):
+    """通知済みの遅延情報からSimHashを取得する (未保存の旧形式は本文から計算する)."""
+    if delay_message.get("fingerprint"):
+        return int(delay_message["fingerprint"], 16)
+    return compute_fingerprint(delay_message.get("messages", ""))
 
-def delay_check(user_route_list, realtime_data_list, railway_list, s3_delay_list):
+
+def is_duplicate_message(fingerprint, notified_fingerprint):
+    """2つのSimHashのハミング距離が閾値以下であればTrueを返す."""
+    distance = (fingerprint ^ notified_fingerprint).bit_count()
+    return distance <= DUPLICATE_MAX_HAMMING_DISTANCE
+
+
+def delay_check(user_route_list, train_information_map, catalog, delay_records):
+    """ユーザーが設定した各路線について遅延を判定し、新規の遅延を通知キューに登録する.
+
+    Args:
+        user_route_list (list): 処理対象の鉄道IDのリスト。
+        train_information_map (dict): 鉄道IDの整数コードごとのTrainInformation。
+        catalog (RailwayCatalog): 鉄道IDのカタログ。
+        delay_records (list[DelayRecord]): 前回通知済みの遅延情報のリスト。
+
+    Returns:
+        list[DelayRecord]: 今回保存する通知済みの遅延情報のリスト。
+    """
     # アクティブユーザーが設定した各路線について遅延をチェック
-    new_delay_messages_list = []
-    id_to_name_map = {item["odpt:railway"]: item["route"] for item in railway_list}
+    new_delay_records = []
     ng_words = [word.strip() for word in NG_WORD.split(",")] if NG_WORD else []
+    # 路線名ごとの通知済みの遅延情報
+    notified_map = {delay_record.route: delay_record for delay_record in delay_records}
+    # 通知対象と判定した路線 (鉄道ID, 路線名, メッセージ, SimHash)
+    notify_targets = []
+    # フェーズ全体の集計 (路線ごとの判定結果は最後にまとめて出力する)
+    phase_counts = Counter()
 
     logger.info(
-        f"アクティブユーザーの {len(user_route_list)} 件の路線の処理を開始します。"
+        "アクティブユーザーの %d 件の路線の処理を開始します。", len(user_route_list)
     )
     for user_route_id in user_route_list:
-        user_route_name = id_to_name_map.get(user_route_id)
-        if not user_route_name:
+        railway = catalog.intern(user_route_id)
+        if railway is None:
+            phase_counts["unknown_route"] += 1
             logger.warning(
-                f"''{user_route_id}''に一致する鉄道名が見つかりませんでした。スキップします。",
+                "'%s'に一致する鉄道名が見つかりませんでした。スキップします。",
+                user_route_id,
                 extra={"user_route_id": user_route_id},
             )
             continue
+        user_route_name = catalog.route_name(railway)
 
         logger.debug(
-            f"--- 路線'{user_route_name}'の処理を開始 ---",
+            "--- 路線'%s'の処理を開始 ---",
+            user_route_name,
             extra={"user_route": user_route_name},
         )
         send_flg = False
         message = None
 
         # 鉄道名に一致するリアルタイム運行情報を検索
-        for realtime_data in realtime_data_list:
-            if realtime_data.get("odpt:railway") == user_route_id:
-                info_text = realtime_data.get("odpt:trainInformationText", {})
-                if isinstance(info_text, dict):
-                    message = info_text.get("ja", "")
-                else:
-                    message = str(info_text) if info_text else ""
-                break
+        train_information = train_information_map.get(railway)
+        if train_information is not None:
+            message = train_information.message
         if not message:
+            phase_counts["no_realtime_data"] += 1
             logger.warning(
-                f"鉄道名'{user_route_id}'のリアルタイム情報が見つかりませんでした。スキップします。",
+                "鉄道名'%s'のリアルタイム情報が見つかりませんでした。スキップします。",
+                user_route_id,
                 extra={"railway_name": user_route_id},
             )
             continue
         logger.debug(
-            f"運行情報メッセージが見つかりました: '{message}'",
-            extra={"railway_name": user_route_id, "message": message},
+            "運行情報メッセージが見つかりました: '%s'",
+            message,
+            extra={"railway_name": user_route_id, "delay_message": message},
         )
 
-        # 取得した運行情報が、既に通知済のメッセージかチェック
+        # 取得した運行情報が、この路線で既に通知済のメッセージとほぼ同じかチェック
+        # (時刻や軽微な文言だけが変わった再発行は、同じメッセージとみなす)
+        fingerprint = compute_fingerprint(message)
         is_new_message = True
-        for delay_message in s3_delay_list:
-            if delay_message.get("messages") == message:
-                is_new_message = False
-                logger.info(
-                    "このメッセージは既に通知済みです。スキップします。",
-                    extra={"message": message},
-                )
-                break
+        notified_record = notified_map.get(user_route_name)
+        if notified_record and is_duplicate_message(
+            fingerprint, notified_record.fingerprint
+        ):
+            is_new_message = False
+            phase_counts["duplicate"] += 1
+            logger.info(
+                "このメッセージは既に通知済みです。スキップします。",
+                extra={"user_route": user_route_name, "delay_message": message},
+            )
+            # 通知済みの内容を引き継ぎ、次回以降も同じメッセージを再送しないようにする
+            new_delay_records.append(notified_record)
 
         if is_new_message:
             # 遅延のメッセージ内容かチェック
@@ -461,33 +1820,109 @@ def delay_check(user_route_list, realtime_data_list, railway_list, s3_delay_list
 
             if is_delay:
                 send_flg = True
+            else:
+                phase_counts["not_delay"] += 1
 
         # 通知フラグがTrueの場合、通知処理を実行
         if send_flg:
+            phase_counts["notify"] += 1
             logger.info(
                 "新規の遅延またはステータス変更を検知しました。通知の準備をします。",
-                extra={"user_route": user_route_name, "message": message},
+                extra={"user_route": user_route_name, "delay_message": message},
             )
 
-            message_object = create_snd_message(user_route_name, message)
-
-            # パーティションキーでユーザーの項目を全て取得
-            response = user_table.query(
-                IndexName="route-index",
-                KeyConditionExpression=Key(ROUTE_COLUMN_NAME).eq(user_route_id),
+            notify_targets.append(
+                (user_route_id, user_route_name, message, fingerprint)
             )
 
-            user_list = [
-                item[PRIMARY_USER_KEY_NAME] for item in response.get("Items", [])
-            ]
+    logger.info(
+        "遅延判定が完了しました。通知対象: %d 件",
+        len(notify_targets),
+        extra={"route_count": len(user_route_list), **phase_counts},
+    )
+    if not notify_targets:
+        return new_delay_records
 
-            for user_id in user_list:
-                snd_line_message(user_id, message_object)
+    # 通知対象の全路線の登録ユーザーを、転置インデックスから一括で取得
+    subscribers_map = get_route_subscribers(
+        [user_route_id for user_route_id, _, _, _ in notify_targets]
+    )
 
-            new_delay_message = {"route": user_route_name, "messages": message}
-            new_delay_messages_list.append(new_delay_message)
+    for user_route_id, user_route_name, message, fingerprint in notify_targets:
+        user_list = sorted(subscribers_map.get(user_route_id, set()))
 
-    return new_delay_messages_list
+        # 送信はアウトボックス経由で行い、検知処理はここで完了させる
+        enqueue_notifications(user_route_id, user_route_name, message, user_list)
+
+        new_delay_records.append(DelayRecord(user_route_name, message, fingerprint))
+
+    return new_delay_records
+
+
+def get_newly_notified_records(new_delay_records, delay_records):
+    """今回新たに通知した遅延情報 (前回から引き継いだものを除く) を返す.
+
+    Args:
+        new_delay_records (list[DelayRecord]): 今回保存する通知済みの遅延情報のリスト。
+        delay_records (list[DelayRecord]): 前回通知済みの遅延情報のリスト。
+
+    Returns:
+        list[DelayRecord]: 今回新たに通知した遅延情報のリスト。
+    """
+    notified_fingerprints = {
+        delay_record.route: delay_record.fingerprint for delay_record in delay_records
+    }
+    return [
+        delay_record
+        for delay_record in new_delay_records
+        if notified_fingerprints.get(delay_record.route) != delay_record.fingerprint
+    ]
+
+
+def append_delay_history(new_delay_records, delay_records, railway_list, context=None):
+    """今回新たに通知した遅延情報を、S3の遅延履歴に追記する.
+
+    前回から引き継いだ通知済みの遅延情報は含めないため、書き込み量は今回の通知件数に比例する。
+    履歴の保存は通知に必須ではないため、失敗しても警告ログのみ出力する。
+
+    Args:
+        new_delay_records (list[DelayRecord]): 今回保存する通知済みの遅延情報のリスト。
+        delay_records (list[DelayRecord]): 前回通知済みの遅延情報のリスト。
+        railway_list (list): 路線名と鉄道IDのマッピング。
+        context (object, optional): Lambdaの実行コンテキスト (リクエストIDを実行IDに使用)。
+
+    Returns:
+        str | None: 書き込んだ履歴オブジェクトのキー。書き込まなかった場合はNone。
+    """
+    if not DELAY_HISTORY_ENABLED:
+        return None
+
+    name_to_id_map = {item["route"]: item["odpt:railway"] for item in railway_list}
+    events = [
+        {
+            "route": delay_record.route,
+            "railway": name_to_id_map.get(delay_record.route),
+            "message": delay_record.messages,
+            "fingerprint": format_fingerprint(delay_record.fingerprint),
+        }
+        for delay_record in get_newly_notified_records(new_delay_records, delay_records)
+    ]
+    run_id = getattr(context, "aws_request_id", None) or uuid.uuid4().hex
+
+    try:
+        store = delay_history.S3HistoryStore(S3_BUCKET_NAME, get_aws_client("s3"))
+        key = delay_history.write_events(store, events, run_id)
+    except ClientError:
+        logger.warning("遅延履歴の保存に失敗しました。", exc_info=True)
+        return None
+
+    if key:
+        logger.info(
+            "遅延履歴に %d 件のイベントを追記しました。",
+            len(events),
+            extra={"key": key, "event_count": len(events)},
+        )
+    return key
 
 
 def lambda_handler(event, context):
@@ -499,16 +1934,40 @@ def lambda_handler(event, context):
     3. 1と2の路線情報を統合し、S3にキャッシュとして保存する。
     4. 交通情報APIからリアルタイムの運行情報を取得する。
     5. ユーザが設定した路線に遅延が発生しているか判定する。
-    6. 新規の遅延が発生している場合、対象ユーザにLINEで通知する。
+    6. 新規の遅延が発生している場合、対象ユーザへの通知をアウトボックスに保存し、
+       遅延履歴に追記する。
+    7. アウトボックスの未配信通知をLINEで送信する。
+
+    イベントに{"action": "deliver"}が指定された場合は、7の配信処理のみを実行する
+    (EventBridgeから毎分実行し、再送待ちの通知をバックオフの間隔どおりに送信する)。
+    {"action": "check_route_index"}が指定された場合は、転置インデックスの整合性チェックのみを
+    実行する ("repair": trueを指定すると差分を修復する)。
 
     Args:
-        event (dict): Lambdaに渡されるイベントデータ (今回は未使用)。
-        context (object): Lambdaの実行コンテキスト情報 (今回は未使用)。
+        event (dict): Lambdaに渡されるイベントデータ。
+        context (object): Lambdaの実行コンテキスト情報 (配信処理の残り時間判定に使用)。
 
     Returns:
         dict: 処理結果を示すステータスコードとメッセージを含む辞書。
     """
     try:
+        event = event or {}
+        action = event.get("action")
+        if action == "deliver":
+            deliver_outbox(context)
+            return {
+                "statusCode": 200,
+                "body": json.dumps(
+                    "Delivery finished successfully.", ensure_ascii=False
+                ),
+            }
+        if action == "check_route_index":
+            differences = check_route_index(repair=bool(event.get("repair")))
+            return {
+                "statusCode": 200,
+                "body": json.dumps(differences, ensure_ascii=False),
+            }
+
         # --- 1. 処理対象の路線リストの準備 ---
         # S3キャッシュとDynamoDBから最新の路線リストを構築する
 
@@ -516,8 +1975,11 @@ def lambda_handler(event, context):
         s3_route_list = get_s3_object(S3_BUCKET_NAME, ROUTE_LIST_FILE_KEY) or []
         # 直近で設定変更のあったユーザーリストを取得
         s3_lineuserid_list = get_s3_object(S3_BUCKET_NAME, USER_LIST_FILE_KEY) or []
-        # 直近の遅延情報リスト
+        # 直近の遅延情報リスト (遅延判定と遅延履歴で共有するため、一度だけレコード型に射影する)
         s3_delay_list = get_s3_object(S3_BUCKET_NAME, DELAY_MESSAGES_FILE_KEY) or []
+        delay_records = [
+            DelayRecord.from_dict(delay_message) for delay_message in s3_delay_list
+        ]
 
         if not s3_lineuserid_list:
             logger.info(
@@ -534,7 +1996,7 @@ def lambda_handler(event, context):
             s3_route_list = list(set(user_route_list + s3_route_list))
 
         route_string = json.dumps(s3_route_list, indent=2, ensure_ascii=False)
-        s3_client.put_object(
+        get_aws_client("s3").put_object(
             Bucket=S3_BUCKET_NAME, Key=ROUTE_LIST_FILE_KEY, Body=route_string
         )
         logger.info(
@@ -556,27 +2018,46 @@ def lambda_handler(event, context):
         )
 
         # --- 5. 遅延判定と通知処理 ---
-        new_delay_messages_list = delay_check(
-            s3_route_list, realtime_data_list, railway_list, s3_delay_list
+        new_delay_records = delay_check_sharded(
+            s3_route_list, realtime_data_list, railway_list, delay_records
         )
 
-        if new_delay_messages_list:
-            s3_client.put_object(
+        if new_delay_records:
+            new_delay_messages_list = [
+                delay_record.to_dict() for delay_record in new_delay_records
+            ]
+            get_aws_client("s3").put_object(
                 Bucket=S3_BUCKET_NAME,
                 Key=DELAY_MESSAGES_FILE_KEY,
                 Body=json.dumps(new_delay_messages_list, ensure_ascii=False),
             )
         else:
-            s3_client.delete_object(
+            get_aws_client("s3").delete_object(
                 Bucket=S3_BUCKET_NAME,
                 Key=DELAY_MESSAGES_FILE_KEY,
             )
 
-        s3_client.delete_object(
+        get_aws_client("s3").delete_object(
             Bucket=S3_BUCKET_NAME,
             Key=USER_LIST_FILE_KEY,
         )
 
+        # 今回新たに通知した遅延情報のみを、日付ごとの遅延履歴に追記する
+        append_delay_history(new_delay_records, delay_records, railway_list, context)
+
+        # --- 6. アウトボックスの配信 ---
+        # 検知結果の保存後に配信するため、配信中にタイムアウトしても未配信分は次回に持ち越される
+        # (今回保存した通知は、GSIへの反映を待たずにベーステーブルから取得して配信する)
+        name_to_id_map = {item["route"]: item["odpt:railway"] for item in railway_list}
+        outbox_keys = [
+            make_outbox_key(name_to_id_map[delay_record.route], delay_record.messages)
+            for delay_record in get_newly_notified_records(
+                new_delay_records, delay_records
+            )
+            if delay_record.route in name_to_id_map
+        ]
+        deliver_outbox(context, outbox_keys)
+
         logger.info("== Lambdaハンドラの処理が正常に終了しました。 ==")
         return {
             "statusCode": 200,
@@ -0,0 +1,311 @@
+# -*- coding: utf-8 -*-
+"""遅延通知の履歴を、日付で分割したgzip圧縮のJSON Linesとして保存・検索するモジュール.
+
+履歴は実行ごとに1つのオブジェクトとして追記し、既存のオブジェクトは書き換えない。
+保存先はS3バケットまたはローカルディレクトリで、キーは次の形式とする。
+
+    delay-history/dt=YYYY-MM-DD/<HHMMSS>-<実行ID>.jsonl.gz
+
+日付 (dt) は日本時間で区切る。検索時は指定した期間の日付のパーティションのみを参照する。
+
+コマンドラインから路線ごとの集計を出力できる。
+
+    python delay_history.py s3://<バケット名> --from 2026-09-01 --to 2026-09-30
+    python delay_history.py ./history --from 2026-09-01 --to 2026-09-30 --route 東京メトロ銀座線
+"""
+
+import argparse
+import gzip
+import json
+import os
+import sys
+from datetime import date, datetime, time, timedelta, timezone
+
+HISTORY_PREFIX = "delay-history"  # 履歴を保存するキーのプレフィックス
+PARTITION_KEY_FORMAT = "dt=%Y-%m-%d"
+HISTORY_FILE_SUFFIX = ".jsonl.gz"
+JST = timezone(timedelta(hours=9), "JST")  # パーティションを区切るタイムゾーン
+
+
+class S3HistoryStore:
+    """S3バケットを履歴の保存先とするストア."""
+
+    def __init__(self, bucket_name, s3_client=None):
+        """ストアを初期化する.
+
+        Args:
+            bucket_name (str): S3バケット名。
+            s3_client (botocore.client.S3, optional): 使用するS3クライアント。
+                省略した場合はboto3で生成する。
+        """
+        if s3_client is None:
+            import boto3
+
+            s3_client = boto3.client("s3")
+        self.bucket_name = bucket_name
+        self.s3_client = s3_client
+
+    def write(self, key, body):
+        self.s3_client.put_object(
+            Bucket=self.bucket_name,
+            Key=key,
+            Body=body,
+            ContentType="application/x-ndjson",
+            ContentEncoding="gzip",
+        )
+
+    def read(self, key):
+        response = self.s3_client.get_object(Bucket=self.bucket_name, Key=key)
+        return response["Body"].read()
+
+    def list_keys(self, prefix):
+        paginator = self.s3_client.get_paginator("list_objects_v2")
+        keys = []
+        for page in paginator.paginate(Bucket=self.bucket_name, Prefix=prefix):
+            keys.extend(item["Key"] for item in page.get("Contents", []))
+        return sorted(keys)
+
+
+class LocalHistoryStore:
+    """ローカルディレクトリを履歴の保存先とするストア (検証・ベンチマーク用)."""
+
+    def __init__(self, root_dir):
+        self.root_dir = root_dir
+
+    def write(self, key, body):
+        path = os.path.join(self.root_dir, key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "wb") as f:
+            f.write(body)
+
+    def read(self, key):
+        with open(os.path.join(self.root_dir, key), "rb") as f:
+            return f.read()
+
+    def list_keys(self, prefix):
+        directory = os.path.join(self.root_dir, prefix)
+        if not os.path.isdir(directory):
+            return []
+        return sorted(f"{prefix}{name}" for name in os.listdir(directory))
+
+
+def open_store(location):
+    """保存先の指定からストアを生成する.
+
+    Args:
+        location (str): "s3://<バケット名>"、またはローカルディレクトリのパス。
+
+    Returns:
+        S3HistoryStore | LocalHistoryStore: 履歴のストア。
+    """
+    if location.startswith("s3://"):
+        return S3HistoryStore(location[len("s3://") :].strip("/"))
+    return LocalHistoryStore(location)
+
+
+def get_partition_prefix(partition_date):
+    """日付のパーティションのキーのプレフィックスを返す."""
+    return f"{HISTORY_PREFIX}/{partition_date.strftime(PARTITION_KEY_FORMAT)}/"
+
+
+def build_history_key(detected_at, run_id):
+    """実行日時と実行IDから、履歴オブジェクトのキーを生成する."""
+    detected_at = detected_at.astimezone(JST)
+    return (
+        f"{get_partition_prefix(detected_at.date())}"
+        f"{detected_at.strftime('%H%M%S')}-{run_id}{HISTORY_FILE_SUFFIX}"
+    )
+
+
+def write_events(store, events, run_id, detected_at=None):
+    """1回の実行で検知したイベントを、1つの履歴オブジェクトとして追記する.
+
+    書き込むのは今回のイベントのみで、既存のパーティションは読み込まない。
+
+    Args:
+        store (S3HistoryStore | LocalHistoryStore): 履歴のストア。
+        events (list[dict]): 追記するイベントのリスト。
+        run_id (str): 実行ID (LambdaのリクエストID等)。
+        detected_at (datetime, optional): 検知日時。省略した場合は現在日時。
+
+    Returns:
+        str | None: 書き込んだオブジェクトのキー。イベントが無い場合はNone。
+    """
+    if not events:
+        return None
+
+    detected_at = (detected_at or datetime.now(JST)).astimezone(JST)
+    detected_at_text = detected_at.isoformat(timespec="seconds")
+    lines = [
+        json.dumps(
+            {"detectedAt": detected_at_text, "runId": run_id, **event},
+            ensure_ascii=False,
+        )
+        for event in events
+    ]
+    body = gzip.compress(("\n".join(lines) + "\n").encode("utf-8"))
+
+    key = build_history_key(detected_at, run_id)
+    store.write(key, body)
+    return key
+
+
+def _to_datetime(value):
+    """日付・日時を日本時間のdatetimeに変換する (日付はその日の0時とする)."""
+    if isinstance(value, datetime):
+        if value.tzinfo is None:
+            return value.replace(tzinfo=JST)
+        return value.astimezone(JST)
+    return datetime.combine(value, time.min, tzinfo=JST)
+
+
+def iter_partition_keys(store, start, end):
+    """期間 [start, end) に含まれる日付のパーティションの履歴オブジェクトのキーを、古い順に返す.
+
+    Args:
+        store (S3HistoryStore | LocalHistoryStore): 履歴のストア。
+        start (date | datetime): 期間の開始 (この日時を含む)。
+        end (date | datetime): 期間の終了 (この日時を含まない)。
+
+    Yields:
+        str: 履歴オブジェクトのキー。
+    """
+    start_at, end_at = _to_datetime(start), _to_datetime(end)
+    partition_date = start_at.date()
+    while _to_datetime(partition_date) < end_at:
+        for key in store.list_keys(get_partition_prefix(partition_date)):
+            if key.endswith(HISTORY_FILE_SUFFIX):
+                yield key
+        partition_date += timedelta(days=1)
+
+
+def iter_events(store, start, end, routes=None):
+    """期間 [start, end) のイベントを、検知日時の古い順に返す.
+
+    ベンチマーク等で、過去の検知結果を再生するためにも使用する。
+
+    Args:
+        store (S3HistoryStore | LocalHistoryStore): 履歴のストア。
+        start (date | datetime): 期間の開始 (この日時を含む)。
+        end (date | datetime): 期間の終了 (この日時を含まない)。
+        routes (Iterable[str], optional): 対象とする路線名。省略した場合は全路線。
+
+    Yields:
+        dict: 履歴のイベント。
+    """
+    start_at, end_at = _to_datetime(start), _to_datetime(end)
+    route_set = set(routes) if routes else None
+
+    for key in iter_partition_keys(store, start_at, end_at):
+        lines = gzip.decompress(store.read(key)).decode("utf-8").splitlines()
+        for line in lines:
+            if not line:
+                continue
+            event = json.loads(line)
+            if route_set is not None and event.get("route") not in route_set:
+                continue
+            if start_at <= datetime.fromisoformat(event["detectedAt"]) < end_at:
+                yield event
+
+
+def iter_replay(store, start, end):
+    """履歴を実行単位にまとめ、運行情報APIのレスポンスと同じ形式で返す.
+
+    遅延判定 (delay_check) に過去の運行情報を順に入力し、検知処理の
+    ベンチマークや動作確認に使用する。
+
+    Args:
+        store (S3HistoryStore | LocalHistoryStore): 履歴のストア。
+        start (date | datetime): 期間の開始 (この日時を含む)。
+        end (date | datetime): 期間の終了 (この日時を含まない)。
+
+    Yields:
+        tuple[str, list[dict]]: 検知日時と、運行情報APIのレコード形式のリスト。
+    """
+    current_run = None
+    realtime_data_list = []
+    for event in iter_events(store, start, end):
+        run = (event["detectedAt"], event["runId"])
+        if run != current_run:
+            if realtime_data_list:
+                yield current_run[0], realtime_data_list
+            current_run, realtime_data_list = run, []
+        realtime_data_list.append(
+            {
+                "odpt:railway": event.get("railway"),
+                "odpt:trainInformationText": {"ja": event.get("message", "")},
+            }
+        )
+    if realtime_data_list:
+        yield current_run[0], realtime_data_list
+
+
+def aggregate_by_route(events):
+    """イベントを路線ごとに集計する.
+
+    Args:
+        events (Iterable[dict]): 履歴のイベント。
+
+    Returns:
+        dict: 路線名をキーとし、通知回数 (count)、通知のあった日数 (days)、
+              最初と最後の検知日時 (firstDetectedAt, lastDetectedAt) を値とする辞書。
+    """
+    summary = {}
+    for event in events:
+        route = event.get("route")
+        detected_at = event["detectedAt"]
+        route_summary = summary.get(route)
+        if route_summary is None:
+            route_summary = summary[route] = {
+                "count": 0,
+                "days": set(),
+                "firstDetectedAt": detected_at,
+                "lastDetectedAt": detected_at,
+            }
+        route_summary["count"] += 1
+        route_summary["days"].add(detected_at[:10])
+        route_summary["firstDetectedAt"] = min(
+            route_summary["firstDetectedAt"], detected_at
+        )
+        route_summary["lastDetectedAt"] = max(
+            route_summary["lastDetectedAt"], detected_at
+        )
+
+    for route_summary in summary.values():
+        route_summary["days"] = len(route_summary["days"])
+    return summary
+
+
+def main(argv=None):
+    """期間と路線を指定して、路線ごとの集計結果をJSONで出力する."""
+    parser = argparse.ArgumentParser(
+        description="遅延通知の履歴を路線ごとに集計します。"
+    )
+    parser.add_argument("location", help="s3://<バケット名> またはローカルディレクトリ")
+    parser.add_argument(
+        "--from",
+        dest="start",
+        required=True,
+        type=date.fromisoformat,
+        help="集計期間の開始日 (YYYY-MM-DD、この日を含む)",
+    )
+    parser.add_argument(
+        "--to",
+        dest="end",
+        required=True,
+        type=date.fromisoformat,
+        help="集計期間の終了日 (YYYY-MM-DD、この日を含む)",
+    )
+    parser.add_argument("--route", action="append", help="対象の路線名 (複数指定可)")
+    args = parser.parse_args(argv)
+
+    store = open_store(args.location)
+    events = iter_events(
+        store, args.start, args.end + timedelta(days=1), routes=args.route
+    )
+    json.dump(aggregate_by_route(events), sys.stdout, ensure_ascii=False, indent=2)
+    sys.stdout.write("\n")
+
+
+if __name__ == "__main__":
+    main()
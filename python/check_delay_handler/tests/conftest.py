@@ -0,0 +1,99 @@
+# -*- coding: utf-8 -*-
+"""check_delay_handlerのテスト共通設定."""
+
+import json
+import os
+import sys
+
+import pytest
+
+# Lambdaの環境変数はモジュール読み込み時に参照されるため、インポート前に設定する
+os.environ.setdefault("AWS_DEFAULT_REGION", "ap-northeast-1")
+os.environ.setdefault("AWS_ACCESS_KEY_ID", "testing")
+os.environ.setdefault("AWS_SECRET_ACCESS_KEY", "testing")
+os.environ.setdefault("S3_OUTPUT_BUCKET", "train-alert-test")
+os.environ.setdefault("USER_TABLE_NAME", "users")
+os.environ.setdefault("ROUTE_SUBSCRIBERS_TABLE_NAME", "route-subscribers")
+os.environ.setdefault("OUTBOX_TABLE_NAME", "notification-outbox")
+os.environ.setdefault("LOG_FORMAT", "TEXT")
+
+FUNCTION_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RAILWAY_LIST_PATH = os.path.join(os.path.dirname(FUNCTION_DIR), "railway_list.json")
+sys.path.insert(0, FUNCTION_DIR)
+
+import check_delay_handler as cdh  # noqa: E402
+
+
+@pytest.fixture
+def railway_list():
+    with open(RAILWAY_LIST_PATH, encoding="utf-8") as f:
+        return json.load(f)
+
+
+@pytest.fixture
+def aws(monkeypatch):
+    """motoでDynamoDB・S3をモックし、Lambdaと同じ構成のテーブルを作成する."""
+    moto = pytest.importorskip("moto")
+    import boto3
+
+    with moto.mock_aws():
+        # モック開始前に生成したクライアントを使用しないよう、生成済みの登録を破棄する
+        monkeypatch.setattr(cdh, "_aws_objects", {})
+        dynamodb = boto3.client("dynamodb")
+        dynamodb.create_table(
+            TableName=cdh.USER_TABLE_NAME,
+            KeySchema=[
+                {"AttributeName": "lineUserId", "KeyType": "HASH"},
+                {"AttributeName": "settingOrRoute", "KeyType": "RANGE"},
+            ],
+            AttributeDefinitions=[
+                {"AttributeName": "lineUserId", "AttributeType": "S"},
+                {"AttributeName": "settingOrRoute", "AttributeType": "S"},
+            ],
+            GlobalSecondaryIndexes=[
+                {
+                    "IndexName": "route-index",
+                    "KeySchema": [
+                        {"AttributeName": "settingOrRoute", "KeyType": "HASH"},
+                        {"AttributeName": "lineUserId", "KeyType": "RANGE"},
+                    ],
+                    "Projection": {"ProjectionType": "KEYS_ONLY"},
+                }
+            ],
+            BillingMode="PAY_PER_REQUEST",
+        )
+        dynamodb.create_table(
+            TableName=cdh.ROUTE_SUBSCRIBERS_TABLE_NAME,
+            KeySchema=[{"AttributeName": "routeId", "KeyType": "HASH"}],
+            AttributeDefinitions=[{"AttributeName": "routeId", "AttributeType": "S"}],
+            BillingMode="PAY_PER_REQUEST",
+        )
+        dynamodb.create_table(
+            TableName=cdh.OUTBOX_TABLE_NAME,
+            KeySchema=[
+                {"AttributeName": "outboxKey", "KeyType": "HASH"},
+                {"AttributeName": "lineUserId", "KeyType": "RANGE"},
+            ],
+            AttributeDefinitions=[
+                {"AttributeName": "outboxKey", "AttributeType": "S"},
+                {"AttributeName": "lineUserId", "AttributeType": "S"},
+                {"AttributeName": "deliveryStatus", "AttributeType": "S"},
+                {"AttributeName": "nextAttemptAt", "AttributeType": "N"},
+            ],
+            GlobalSecondaryIndexes=[
+                {
+                    "IndexName": cdh.OUTBOX_PENDING_INDEX_NAME,
+                    "KeySchema": [
+                        {"AttributeName": "deliveryStatus", "KeyType": "HASH"},
+                        {"AttributeName": "nextAttemptAt", "KeyType": "RANGE"},
+                    ],
+                    "Projection": {"ProjectionType": "ALL"},
+                }
+            ],
+            BillingMode="PAY_PER_REQUEST",
+        )
+        boto3.client("s3").create_bucket(
+            Bucket=cdh.S3_BUCKET_NAME,
+            CreateBucketConfiguration={"LocationConstraint": "ap-northeast-1"},
+        )
+        yield boto3.resource("dynamodb")
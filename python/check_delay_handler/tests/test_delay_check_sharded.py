@@ -0,0 +1,108 @@
+# -*- coding: utf-8 -*-
+"""シャード分割した遅延チェックが、単一ループと同じ結果になることのテスト."""
+
+import multiprocessing
+
+import pytest
+
+import check_delay_handler as cdh
+
+
+@pytest.fixture
+def stub_io(monkeypatch):
+    """転置インデックスとアウトボックスへのアクセスを、プロセス内の記録に置き換える."""
+    enqueued = []
+
+    def get_route_subscribers(route_ids):
+        return {route_id: {f"U-{route_id}"} for route_id in route_ids}
+
+    def enqueue_notifications(user_route_id, user_route_name, message, user_list):
+        enqueued.append((user_route_id, message, tuple(user_list)))
+        return len(user_list)
+
+    monkeypatch.setattr(cdh, "get_route_subscribers", get_route_subscribers)
+    monkeypatch.setattr(cdh, "enqueue_notifications", enqueue_notifications)
+    return enqueued
+
+
+def make_inputs(railway_list):
+    route_ids = [item["odpt:railway"] for item in railway_list]
+    realtime_data_list = [
+        {
+            "odpt:railway": route_id,
+            "odpt:trainInformationText": {"ja": f"{route_id}で遅延が発生しています。"},
+        }
+        for route_id in route_ids
+    ]
+    # 一部の路線は前回と同じメッセージを通知済みとする
+    s3_delay_list = [
+        {
+            "route": item["route"],
+            "messages": f"{item['odpt:railway']}で遅延が発生しています。",
+        }
+        for item in railway_list[::3]
+    ]
+    return route_ids, realtime_data_list, s3_delay_list
+
+
+def run(
+    monkeypatch,
+    shards,
+    executor,
+    route_ids,
+    realtime_data_list,
+    railway_list,
+    s3_delay_list,
+):
+    monkeypatch.setattr(cdh, "DELAY_CHECK_SHARDS", shards)
+    monkeypatch.setattr(cdh, "DELAY_CHECK_EXECUTOR", executor)
+    delay_records = [cdh.DelayRecord.from_dict(item) for item in s3_delay_list]
+    records = cdh.delay_check_sharded(
+        route_ids, realtime_data_list, railway_list, delay_records
+    )
+    return sorted((record.to_dict() for record in records), key=lambda d: d["route"])
+
+
+@pytest.mark.parametrize(
+    "executor",
+    [
+        "thread",
+        pytest.param(
+            "process",
+            marks=pytest.mark.skipif(
+                multiprocessing.get_start_method() != "fork",
+                reason="プロセスプールのワーカーにスタブを引き継ぐためforkが必要",
+            ),
+        ),
+    ],
+)
+def test_sharded_result_matches_serial(monkeypatch, stub_io, railway_list, executor):
+    inputs = make_inputs(railway_list)
+    serial = run(monkeypatch, 1, "thread", *inputs[:2], railway_list, inputs[2])
+    serial_enqueued = sorted(stub_io)
+    stub_io.clear()
+
+    sharded = run(monkeypatch, 4, executor, *inputs[:2], railway_list, inputs[2])
+
+    assert sharded == serial
+    assert len(serial) == len(railway_list)
+    if executor == "thread":
+        # プロセスプールではワーカー側で記録されるため、スレッドの場合のみ比較する
+        assert sorted(stub_io) == serial_enqueued
+        assert len(serial_enqueued) == len(railway_list) - len(inputs[2])
+
+
+def test_partition_routes_is_stable_when_shard_is_added(railway_list):
+    route_ids = [item["odpt:railway"] for item in railway_list]
+    before = cdh.partition_routes(route_ids, 4)
+    after = cdh.partition_routes(route_ids, 5)
+
+    assert sorted(sum(before, [])) == sorted(route_ids)
+    # コンシステントハッシュのため、シャードを1つ追加しても大半の路線は移動しない
+    moved = sum(
+        1
+        for shard, routes in enumerate(before)
+        for route_id in routes
+        if route_id not in after[shard]
+    )
+    assert moved < len(route_ids) / 2
@@ -0,0 +1,141 @@
+# -*- coding: utf-8 -*-
+"""遅延履歴の追記と集計のテスト."""
+
+from datetime import date, datetime, timedelta
+
+import pytest
+
+import check_delay_handler as cdh
+import delay_history
+
+GINZA = "東京メトロ銀座線"
+MARUNOUCHI = "東京メトロ丸ノ内線"
+MESSAGE = "銀座線は、渋谷駅での人身事故の影響で、運転を見合わせています。"
+CHANGED_MESSAGE = "銀座線は、渋谷駅での人身事故の影響で、遅れが出ています。"
+
+
+def make_record(route, message):
+    return cdh.DelayRecord(route, message, cdh.compute_fingerprint(message))
+
+
+class Context:
+    aws_request_id = "request-1"
+
+
+def test_append_delay_history_writes_only_new_notifications(aws, railway_list):
+    delay_records = [make_record(GINZA, MESSAGE)]
+    new_delay_records = [
+        make_record(GINZA, MESSAGE),
+        make_record(MARUNOUCHI, CHANGED_MESSAGE),
+    ]
+
+    key = cdh.append_delay_history(
+        new_delay_records, delay_records, railway_list, Context()
+    )
+
+    store = delay_history.S3HistoryStore(cdh.S3_BUCKET_NAME, cdh.get_aws_client("s3"))
+    assert key.endswith(f"-request-1{delay_history.HISTORY_FILE_SUFFIX}")
+    today = datetime.now(delay_history.JST).date()
+    events = list(
+        delay_history.iter_events(
+            store, today - timedelta(days=1), today + timedelta(days=1)
+        )
+    )
+    assert [(event["route"], event["message"]) for event in events] == [
+        (MARUNOUCHI, CHANGED_MESSAGE)
+    ]
+
+
+def test_append_delay_history_skips_when_nothing_is_new(aws, railway_list):
+    delay_records = [make_record(GINZA, MESSAGE)]
+
+    assert cdh.append_delay_history(delay_records, delay_records, railway_list) is None
+
+
+@pytest.fixture
+def local_store(tmp_path):
+    store = delay_history.LocalHistoryStore(str(tmp_path))
+    events = [{"route": GINZA, "message": MESSAGE}]
+    for detected_at, run_id in (
+        (datetime(2026, 9, 1, 8, 0, tzinfo=delay_history.JST), "run-1"),
+        (datetime(2026, 9, 1, 23, 30, tzinfo=delay_history.JST), "run-2"),
+        (datetime(2026, 9, 3, 7, 0, tzinfo=delay_history.JST), "run-3"),
+    ):
+        delay_history.write_events(store, events, run_id, detected_at)
+    return store
+
+
+def test_iter_events_reads_only_partitions_in_range(local_store):
+    events = list(
+        delay_history.iter_events(local_store, date(2026, 9, 1), date(2026, 9, 2))
+    )
+
+    assert [event["runId"] for event in events] == ["run-1", "run-2"]
+
+
+def test_aggregate_by_route(local_store):
+    events = delay_history.iter_events(local_store, date(2026, 9, 1), date(2026, 10, 1))
+
+    assert delay_history.aggregate_by_route(events) == {
+        GINZA: {
+            "count": 3,
+            "days": 2,
+            "firstDetectedAt": "2026-09-01T08:00:00+09:00",
+            "lastDetectedAt": "2026-09-03T07:00:00+09:00",
+        }
+    }
+
+
+def test_replay_through_delay_check_reproduces_notifications(
+    tmp_path, railway_list, monkeypatch
+):
+    store = delay_history.LocalHistoryStore(str(tmp_path))
+    runs = [
+        (
+            datetime(2026, 9, 1, 8, 0, tzinfo=delay_history.JST),
+            [(GINZA, MESSAGE), (MARUNOUCHI, MESSAGE)],
+        ),
+        (
+            datetime(2026, 9, 1, 8, 30, tzinfo=delay_history.JST),
+            [(GINZA, CHANGED_MESSAGE)],
+        ),
+    ]
+    name_to_id_map = {item["route"]: item["odpt:railway"] for item in railway_list}
+    for index, (detected_at, notified) in enumerate(runs):
+        events = [
+            {"route": route, "railway": name_to_id_map[route], "message": message}
+            for route, message in notified
+        ]
+        delay_history.write_events(store, events, f"run-{index}", detected_at)
+    enqueued = []
+    monkeypatch.setattr(cdh, "get_route_subscribers", lambda route_ids: {})
+    monkeypatch.setattr(
+        cdh,
+        "enqueue_notifications",
+        lambda route_id, route_name, message, user_list: enqueued.append(
+            (route_name, message)
+        ),
+    )
+
+    replay = list(delay_history.iter_replay(store, date(2026, 9, 1), date(2026, 9, 2)))
+
+    assert [detected_at for detected_at, _ in replay] == [
+        "2026-09-01T08:00:00+09:00",
+        "2026-09-01T08:30:00+09:00",
+    ]
+    delay_records = []
+    for (_, realtime_data_list), (_, notified) in zip(replay, runs):
+        user_route_list = [data["odpt:railway"] for data in realtime_data_list]
+        enqueued.clear()
+        delay_records = cdh.delay_check_sharded(
+            user_route_list, realtime_data_list, railway_list, delay_records
+        )
+        # 履歴には新たに通知した遅延のみが記録されているため、再生すると同じ通知が再現される
+        assert enqueued == notified
+
+        # 通知済みの遅延情報を引き継いで同じ運行情報を再入力しても、再度は通知しない
+        enqueued.clear()
+        delay_records = cdh.delay_check_sharded(
+            user_route_list, realtime_data_list, railway_list, delay_records
+        )
+        assert enqueued == []
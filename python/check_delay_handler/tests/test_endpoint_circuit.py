@@ -0,0 +1,173 @@
+# -*- coding: utf-8 -*-
+"""運行情報APIのサーキットブレーカーとヘッジリクエストのテスト.
+
+ローカルのHTTPサーバーを運行情報APIのスタブとし、エラー応答・接続拒否・応答の停滞を
+注入して、get_realtime_train_informationの振る舞いを確認する。
+"""
+
+import json
+import socket
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+import check_delay_handler as cdh
+
+pytest.importorskip("requests")
+
+STUB_LATENCY_SECONDS = 0.01
+STALL_SECONDS = 2
+
+
+class StubEndpoint:
+    """応答の種類を切り替えられる、運行情報APIのスタブサーバー."""
+
+    def __init__(self, name):
+        self.name = name
+        self.mode = "ok"  # ok: 正常応答, error: 500応答, stall_first: 次の1回のみ停滞
+        self.calls = 0
+        self.lock = threading.Lock()
+        endpoint = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                endpoint.handle(self)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.server.daemon_threads = True
+        self.url = f"http://127.0.0.1:{self.server.server_port}/"
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def handle(self, request):
+        with self.lock:
+            self.calls += 1
+            mode = self.mode
+            if mode == "stall_first":
+                self.mode = "ok"
+        if mode == "error":
+            request.send_response(500)
+            request.send_header("Content-Length", "0")
+            request.end_headers()
+            return
+        time.sleep(STALL_SECONDS if mode == "stall_first" else STUB_LATENCY_SECONDS)
+        body = json.dumps([{"odpt:railway": self.name}]).encode("utf-8")
+        request.send_response(200)
+        request.send_header("Content-Type", "application/json")
+        request.send_header("Content-Length", str(len(body)))
+        request.end_headers()
+        request.wfile.write(body)
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def get_refused_url():
+    """接続を拒否される (待ち受けていない) ポートのURLを返す."""
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+    return f"http://127.0.0.1:{port}/"
+
+
+@pytest.fixture
+def endpoints(monkeypatch):
+    """スタブのエンドポイントを2つ起動し、エンドポイントの状態を初期化する."""
+    primary, secondary = StubEndpoint("primary"), StubEndpoint("secondary")
+    monkeypatch.setattr(cdh, "_endpoint_health", {})
+    monkeypatch.setattr(cdh, "_endpoint_health_loaded", True)
+    monkeypatch.setattr(cdh, "ENDPOINT_HEALTH_PERSIST", False)
+    monkeypatch.setattr(cdh, "HEDGE_ENABLED", True)
+    monkeypatch.setattr(cdh, "READ_TIMEOUT", 5)
+    set_endpoint_urls(monkeypatch, [primary.url, secondary.url])
+    yield primary, secondary
+    primary.close()
+    secondary.close()
+
+
+def set_endpoint_urls(monkeypatch, urls):
+    monkeypatch.setattr(
+        cdh, "get_api_url_token_pairs", lambda: [[url, "token"] for url in urls]
+    )
+
+
+def get_railways(realtime_data_list):
+    return [item["odpt:railway"] for item in realtime_data_list or []]
+
+
+def open_circuit(endpoint):
+    endpoint.mode = "error"
+    for _ in range(cdh.CIRCUIT_FAILURE_THRESHOLD):
+        assert get_railways(cdh.get_realtime_train_information()) == ["secondary"]
+    assert cdh._endpoint_health[endpoint.url]["state"] == cdh.CIRCUIT_STATE_OPEN
+
+
+def test_circuit_opens_after_failure_threshold(endpoints):
+    primary, _ = endpoints
+
+    open_circuit(primary)
+    # サーキットが開いている間は呼び出さず、もう一方のエンドポイントの結果を返す
+    for _ in range(2):
+        assert get_railways(cdh.get_realtime_train_information()) == ["secondary"]
+
+    assert primary.calls == cdh.CIRCUIT_FAILURE_THRESHOLD
+
+
+def test_circuit_opens_when_connection_is_refused(endpoints, monkeypatch):
+    _, secondary = endpoints
+    refused_url = get_refused_url()
+    set_endpoint_urls(monkeypatch, [refused_url, secondary.url])
+
+    for _ in range(cdh.CIRCUIT_FAILURE_THRESHOLD):
+        assert get_railways(cdh.get_realtime_train_information()) == ["secondary"]
+
+    assert cdh._endpoint_health[refused_url]["state"] == cdh.CIRCUIT_STATE_OPEN
+
+
+@pytest.mark.parametrize(
+    "probe_mode, expected_state",
+    [("ok", cdh.CIRCUIT_STATE_CLOSED), ("error", cdh.CIRCUIT_STATE_OPEN)],
+)
+def test_half_open_probe_closes_or_reopens_circuit(
+    endpoints, probe_mode, expected_state
+):
+    primary, _ = endpoints
+    open_circuit(primary)
+
+    # CIRCUIT_RESET_SECONDSが経過したものとして、試験的な呼び出しを1回だけ許可させる
+    cdh._endpoint_health[primary.url]["openedAt"] -= cdh.CIRCUIT_RESET_SECONDS
+    primary.mode = probe_mode
+    realtime_data_list = cdh.get_realtime_train_information()
+
+    assert primary.calls == cdh.CIRCUIT_FAILURE_THRESHOLD + 1
+    assert cdh._endpoint_health[primary.url]["state"] == expected_state
+    if expected_state == cdh.CIRCUIT_STATE_CLOSED:
+        assert get_railways(realtime_data_list) == ["primary", "secondary"]
+    else:
+        # 再び開いたサーキットは、次回の実行では呼び出さない
+        cdh.get_realtime_train_information()
+        assert primary.calls == cdh.CIRCUIT_FAILURE_THRESHOLD + 1
+
+
+def test_hedge_request_wins_when_primary_exceeds_p95(endpoints):
+    primary, _ = endpoints
+    for _ in range(cdh.HEDGE_MIN_SAMPLES):
+        cdh.get_realtime_train_information()
+    hedge_delay = cdh.get_hedge_delay(primary.url)
+    assert hedge_delay is not None and hedge_delay < STALL_SECONDS
+
+    primary.mode = "stall_first"
+    primary.calls = 0
+    started_at = time.monotonic()
+    realtime_data_list = cdh.get_realtime_train_information()
+    elapsed = time.monotonic() - started_at
+
+    assert get_railways(realtime_data_list) == ["primary", "secondary"]
+    assert primary.calls == 2
+    assert elapsed < STALL_SECONDS / 2
+    assert cdh._endpoint_health[primary.url]["state"] == cdh.CIRCUIT_STATE_CLOSED
@@ -0,0 +1,60 @@
+# -*- coding: utf-8 -*-
+"""運行情報の本文のSimHashと、重複判定のテスト."""
+
+import hashlib
+import json
+import os
+
+import pytest
+
+import check_delay_handler as cdh
+
+CORPUS_PATH = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "data", "delay_message_corpus.json"
+)
+with open(CORPUS_PATH, encoding="utf-8") as f:
+    CORPUS = json.load(f)
+
+
+def distance(message, other_message):
+    fingerprint = cdh.compute_fingerprint(message)
+    return (fingerprint ^ cdh.compute_fingerprint(other_message)).bit_count()
+
+
+def reference_fingerprint(message):
+    """桁ごとに1の数を数える素朴なSimHash (delay-messages.jsonの保存値との互換確認用)."""
+    normalized = cdh.normalize_message(message)
+    size = cdh.SIMHASH_SHINGLE_SIZE
+    shingles = [normalized[i : i + size] for i in range(len(normalized) - size + 1)]
+    hashes = [
+        int.from_bytes(
+            hashlib.blake2b(s.encode("utf-8"), digest_size=8).digest(), "big"
+        )
+        for s in shingles or [normalized]
+    ]
+    return sum(
+        1 << bit
+        for bit in range(cdh.SIMHASH_BITS)
+        if sum((h >> bit) & 1 for h in hashes) > len(hashes) / 2
+    )
+
+
+@pytest.mark.parametrize("message, reissued_message", CORPUS["same_event"])
+def test_time_only_reissue_is_duplicate(message, reissued_message):
+    assert distance(message, reissued_message) == 0
+
+
+@pytest.mark.parametrize("message, changed_message", CORPUS["changed_event"])
+def test_status_change_exceeds_threshold(message, changed_message):
+    assert distance(message, changed_message) > cdh.DUPLICATE_MAX_HAMMING_DISTANCE
+    assert not cdh.is_duplicate_message(
+        cdh.compute_fingerprint(message), cdh.compute_fingerprint(changed_message)
+    )
+
+
+def test_fingerprint_is_compatible_with_stored_values():
+    messages = [m for pair in CORPUS["changed_event"] for m in pair] + ["", "遅延"]
+    for message in messages:
+        assert cdh.compute_fingerprint(message) == reference_fingerprint(message)
+    fingerprint = cdh.compute_fingerprint(CORPUS["same_event"][0][0])
+    assert cdh.format_fingerprint(fingerprint) == "9de6b85bd37007b4"
@@ -0,0 +1,88 @@
+# -*- coding: utf-8 -*-
+"""構造化ログ (JsonFormatter) とサンプリング出力 (log_sampled) のテスト."""
+
+import io
+import json
+import logging
+
+import pytest
+
+import check_delay_handler as cdh
+
+
+@pytest.fixture
+def json_log(monkeypatch):
+    """JsonFormatterで整形したログを受け取るハンドラを追加し、出力行の取得関数を返す."""
+    stream = io.StringIO()
+    handler = logging.StreamHandler(stream)
+    handler.setFormatter(cdh.JsonFormatter())
+    cdh.logger.addHandler(handler)
+    monkeypatch.setattr(cdh.logger, "level", logging.INFO)
+    yield lambda: [json.loads(line) for line in stream.getvalue().splitlines()]
+    cdh.logger.removeHandler(handler)
+
+
+class CountingArg:
+    """メッセージの組み立て (%sの展開) が行われた回数を数える引数."""
+
+    def __init__(self):
+        self.formatted = 0
+
+    def __str__(self):
+        self.formatted += 1
+        return "arg"
+
+
+def test_extra_keys_are_top_level(json_log):
+    cdh.logger.info("路線 %s を処理", "銀座線", extra={"route": "銀座線", "count": 3})
+
+    (entry,) = json_log()
+    assert entry["message"] == "路線 銀座線 を処理"
+    assert entry["route"] == "銀座線"
+    assert entry["count"] == 3
+    assert entry["level"] == "INFO"
+
+
+def test_exception_is_serialized(json_log):
+    try:
+        raise ValueError("boom")
+    except ValueError:
+        cdh.logger.error("失敗", exc_info=True)
+
+    (entry,) = json_log()
+    assert "ValueError: boom" in entry["exception"]
+
+
+def test_log_sampled_tags_sample_rate_and_caller(json_log, monkeypatch):
+    monkeypatch.setattr(cdh, "LOG_SAMPLE_RATE", 1.0)
+
+    cdh.log_sampled(logging.INFO, "送信 %s", "U1", extra={"user": "U1"})
+
+    (entry,) = json_log()
+    assert entry["message"] == "送信 U1"
+    assert entry["user"] == "U1"
+    assert entry["sample_rate"] == 1.0
+    # 出力位置はlog_sampledではなく、呼び出し元を指す
+    assert entry["location"].startswith("test_log_sampled_tags_sample_rate_and_caller:")
+
+
+def test_log_sampled_skips_when_not_sampled(json_log, monkeypatch):
+    monkeypatch.setattr(cdh, "LOG_SAMPLE_RATE", 0.0)
+
+    cdh.log_sampled(logging.INFO, "送信 %s", "U1")
+
+    assert json_log() == []
+
+
+def test_message_is_not_formatted_below_level(json_log, monkeypatch):
+    monkeypatch.setattr(cdh, "LOG_SAMPLE_RATE", 1.0)
+    arg = CountingArg()
+
+    cdh.logger.debug("詳細 %s", arg)
+    cdh.log_sampled(logging.DEBUG, "詳細 %s", arg)
+    assert arg.formatted == 0
+    assert json_log() == []
+
+    cdh.logger.info("通知 %s", arg)
+    assert arg.formatted >= 1
+    assert [entry["message"] for entry in json_log()] == ["通知 arg"]
@@ -0,0 +1,205 @@
+# -*- coding: utf-8 -*-
+"""アウトボックスへの保存と配信のテスト."""
+
+import pytest
+
+import check_delay_handler as cdh
+
+ROUTE_ID = "odpt.Railway:TokyoMetro.Ginza"
+ROUTE_NAME = "東京メトロ銀座線"
+MESSAGE = "銀座線は、渋谷駅での人身事故の影響で、運転を見合わせています。"
+
+
+@pytest.fixture
+def sent(monkeypatch):
+    """LINEへの送信を、宛先・メッセージ・リトライキーの記録に置き換える."""
+    sent_messages = []
+
+    def snd_line_message(user_id, message_object, retry_key=None):
+        sent_messages.append((user_id, message_object, retry_key))
+        return cdh.SEND_RESULT_SUCCESS
+
+    monkeypatch.setattr(cdh, "snd_line_message", snd_line_message)
+    return sent_messages
+
+
+def get_outbox_items(aws):
+    table = aws.Table(cdh.OUTBOX_TABLE_NAME)
+    items = table.scan()["Items"]
+    return {item[cdh.PRIMARY_USER_KEY_NAME]: item for item in items}
+
+
+def test_enqueue_keeps_pending_items(aws):
+    assert cdh.enqueue_notifications(ROUTE_ID, ROUTE_NAME, MESSAGE, ["U1"]) == 1
+    first = get_outbox_items(aws)["U1"]
+    outbox_key = cdh.make_outbox_key(ROUTE_ID, MESSAGE)
+    aws.Table(cdh.OUTBOX_TABLE_NAME).update_item(
+        Key={"outboxKey": outbox_key, cdh.PRIMARY_USER_KEY_NAME: "U1"},
+        UpdateExpression="SET attempts = :attempts",
+        ExpressionAttributeValues={":attempts": 2},
+    )
+
+    # 検知結果の保存前に異常終了して再実行された場合、未配信の項目は引き継がれる
+    written = cdh.enqueue_notifications(ROUTE_ID, ROUTE_NAME, MESSAGE, ["U1", "U2"])
+
+    items = get_outbox_items(aws)
+    assert written == 1
+    assert items["U1"]["attempts"] == 2
+    assert items["U1"]["retryKey"] == first["retryKey"]
+    assert items["U2"]["deliveryStatus"] == cdh.OUTBOX_STATUS_PENDING
+
+
+def test_enqueue_reopens_delivered_items_with_new_retry_key(aws, sent):
+    cdh.enqueue_notifications(ROUTE_ID, ROUTE_NAME, MESSAGE, ["U1"])
+    cdh.deliver_outbox()
+    delivered = get_outbox_items(aws)["U1"]
+    assert delivered["deliveryStatus"] == cdh.OUTBOX_STATUS_DELIVERED
+
+    # 同じ遅延が再発した場合は、LINE側で重複とみなされないよう新しいリトライキーで送る
+    assert cdh.enqueue_notifications(ROUTE_ID, ROUTE_NAME, MESSAGE, ["U1"]) == 1
+    cdh.deliver_outbox()
+
+    assert [retry_key for _, _, retry_key in sent] == [
+        delivered["retryKey"],
+        get_outbox_items(aws)["U1"]["retryKey"],
+    ]
+    assert sent[0][2] != sent[1][2]
+
+
+def test_deliver_builds_message_once_per_outbox_key(aws, sent, monkeypatch):
+    calls = []
+    create_snd_message = cdh.create_snd_message
+
+    def counting_create_snd_message(user_route, message):
+        calls.append(user_route)
+        return create_snd_message(user_route, message)
+
+    monkeypatch.setattr(cdh, "create_snd_message", counting_create_snd_message)
+    user_list = [f"U{i}" for i in range(5)]
+    cdh.enqueue_notifications(ROUTE_ID, ROUTE_NAME, MESSAGE, user_list)
+
+    counts = cdh.deliver_outbox()
+
+    assert counts[cdh.OUTBOX_STATUS_DELIVERED] == len(user_list)
+    assert calls == [ROUTE_NAME]
+    assert sorted(user_id for user_id, _, _ in sent) == user_list
+
+
+class FakeResponse:
+    def __init__(self, status_code):
+        self.status_code = status_code
+        self.ok = 200 <= status_code < 300
+        self.text = ""
+
+
+@pytest.fixture
+def line_api(monkeypatch):
+    """LINE Push APIの応答を、指定したステータスコードに置き換える."""
+    requests = pytest.importorskip("requests")
+    responses = {"status_code": 200, "headers": []}
+
+    def post(url, headers=None, data=None, timeout=None):
+        responses["headers"].append(headers)
+        return FakeResponse(responses["status_code"])
+
+    monkeypatch.setattr(requests, "post", post)
+    monkeypatch.setattr(cdh, "get_line_access_token", lambda: "token")
+    return responses
+
+
+def query_pending_index(aws):
+    from boto3.dynamodb.conditions import Key
+
+    return aws.Table(cdh.OUTBOX_TABLE_NAME).query(
+        IndexName=cdh.OUTBOX_PENDING_INDEX_NAME,
+        KeyConditionExpression=Key("deliveryStatus").eq(cdh.OUTBOX_STATUS_PENDING),
+    )["Items"]
+
+
+@pytest.mark.parametrize(
+    "status_code, retry_key, expected",
+    [
+        (200, "key", cdh.SEND_RESULT_SUCCESS),
+        (409, "key", cdh.SEND_RESULT_SUCCESS),
+        (409, None, cdh.SEND_RESULT_FAILED),
+        (429, "key", cdh.SEND_RESULT_RETRY),
+        (503, "key", cdh.SEND_RESULT_RETRY),
+        (400, "key", cdh.SEND_RESULT_FAILED),
+    ],
+)
+def test_snd_line_message_classifies_response(
+    line_api, status_code, retry_key, expected
+):
+    line_api["status_code"] = status_code
+
+    assert cdh.snd_line_message("U1", {}, retry_key=retry_key) == expected
+    assert line_api["headers"][0].get("X-Line-Retry-Key") == retry_key
+
+
+def test_new_items_are_delivered_without_waiting_for_index(aws, sent, monkeypatch):
+    # GSIに未反映の状態を再現する (直前に保存した項目が結果整合性で見えない)
+    monkeypatch.setattr(cdh, "get_pending_outbox_items", lambda: [])
+    cdh.enqueue_notifications(ROUTE_ID, ROUTE_NAME, MESSAGE, ["U1", "U2"])
+
+    counts = cdh.deliver_outbox(outbox_keys=[cdh.make_outbox_key(ROUTE_ID, MESSAGE)])
+
+    assert counts[cdh.OUTBOX_STATUS_DELIVERED] == 2
+    assert sorted(user_id for user_id, _, _ in sent) == ["U1", "U2"]
+
+
+def test_delivered_items_leave_pending_index(aws, line_api):
+    cdh.enqueue_notifications(ROUTE_ID, ROUTE_NAME, MESSAGE, ["U1"])
+    assert len(query_pending_index(aws)) == 1
+
+    cdh.deliver_outbox()
+
+    item = get_outbox_items(aws)["U1"]
+    assert item["deliveryStatus"] == cdh.OUTBOX_STATUS_DELIVERED
+    assert "nextAttemptAt" not in item
+    assert query_pending_index(aws) == []
+
+
+@pytest.mark.parametrize("status_code", [429, 500])
+def test_transient_error_schedules_backoff(aws, line_api, status_code):
+    line_api["status_code"] = status_code
+    cdh.enqueue_notifications(ROUTE_ID, ROUTE_NAME, MESSAGE, ["U1"])
+    before = int(cdh.time.time())
+
+    counts = cdh.deliver_outbox()
+
+    item = get_outbox_items(aws)["U1"]
+    assert counts[cdh.OUTBOX_STATUS_PENDING] == 1
+    assert item["deliveryStatus"] == cdh.OUTBOX_STATUS_PENDING
+    assert item["attempts"] == 1
+    backoff = cdh.OUTBOX_BASE_BACKOFF_SECONDS
+    assert before + backoff <= item["nextAttemptAt"] <= int(cdh.time.time()) + backoff
+    # 送信予定時刻までは再送しない
+    assert cdh.deliver_outbox()[cdh.OUTBOX_STATUS_PENDING] == 0
+    assert len(line_api["headers"]) == 1
+
+
+def test_item_fails_at_max_attempts(aws, line_api):
+    line_api["status_code"] = 503
+    cdh.enqueue_notifications(ROUTE_ID, ROUTE_NAME, MESSAGE, ["U1"])
+    item = get_outbox_items(aws)["U1"]
+    item["attempts"] = cdh.OUTBOX_MAX_ATTEMPTS - 1
+
+    status = cdh.deliver_outbox_item(item, {})
+
+    item = get_outbox_items(aws)["U1"]
+    assert status == item["deliveryStatus"] == cdh.OUTBOX_STATUS_FAILED
+    assert item["attempts"] == cdh.OUTBOX_MAX_ATTEMPTS
+    assert query_pending_index(aws) == []
+
+
+def test_retry_after_conflict_counts_as_delivered(aws, line_api):
+    # 前回の送信が成功していた場合、同じリトライキーでの再送は409が返る
+    line_api["status_code"] = 409
+    cdh.enqueue_notifications(ROUTE_ID, ROUTE_NAME, MESSAGE, ["U1"])
+
+    counts = cdh.deliver_outbox()
+
+    item = get_outbox_items(aws)["U1"]
+    assert counts[cdh.OUTBOX_STATUS_DELIVERED] == 1
+    assert item["deliveryStatus"] == cdh.OUTBOX_STATUS_DELIVERED
+    assert line_api["headers"][0]["X-Line-Retry-Key"] == item["retryKey"]
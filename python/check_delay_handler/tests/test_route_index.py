@@ -0,0 +1,84 @@
+# -*- coding: utf-8 -*-
+"""転置インデックス (RouteSubscribersテーブル) の取得と修復のテスト."""
+
+import check_delay_handler as cdh
+
+GINZA = "odpt.Railway:TokyoMetro.Ginza"
+MARUNOUCHI = "odpt.Railway:TokyoMetro.Marunouchi"
+
+
+def put_user_routes(aws, user_id, route_ids):
+    table = aws.Table(cdh.USER_TABLE_NAME)
+    table.put_item(
+        Item={cdh.PRIMARY_USER_KEY_NAME: user_id, cdh.ROUTE_COLUMN_NAME: "#PROFILE#"}
+    )
+    for route_id in route_ids:
+        table.put_item(
+            Item={cdh.PRIMARY_USER_KEY_NAME: user_id, cdh.ROUTE_COLUMN_NAME: route_id}
+        )
+
+
+def put_subscribers(aws, route_id, user_ids):
+    aws.Table(cdh.ROUTE_SUBSCRIBERS_TABLE_NAME).put_item(
+        Item={cdh.ROUTE_INDEX_KEY_NAME: route_id, cdh.SUBSCRIBERS_COLUMN_NAME: user_ids}
+    )
+
+
+def get_subscribers(aws, route_id):
+    item = aws.Table(cdh.ROUTE_SUBSCRIBERS_TABLE_NAME).get_item(
+        Key={cdh.ROUTE_INDEX_KEY_NAME: route_id}
+    )["Item"]
+    return item.get(cdh.SUBSCRIBERS_COLUMN_NAME, set())
+
+
+def test_repair_applies_only_the_difference(aws):
+    put_user_routes(aws, "U1", [GINZA])
+    put_user_routes(aws, "U2", [GINZA, MARUNOUCHI])
+    put_subscribers(aws, GINZA, {"U1", "U3"})
+
+    differences = cdh.check_route_index(repair=True)
+
+    assert differences == {
+        GINZA: {"missing": ["U2"], "extra": ["U3"]},
+        MARUNOUCHI: {"missing": ["U2"], "extra": []},
+    }
+    assert get_subscribers(aws, GINZA) == {"U1", "U2"}
+    assert get_subscribers(aws, MARUNOUCHI) == {"U2"}
+    assert cdh.check_route_index() == {}
+
+
+def test_repair_keeps_users_added_after_the_scan(aws, monkeypatch):
+    put_user_routes(aws, "U1", [GINZA])
+    put_subscribers(aws, GINZA, {"U3"})
+
+    # 差分の検出後・修復前にユーザー設定が保存された場合を再現する
+    logger_info = cdh.logger.info
+
+    def save_settings_during_check(msg, *args, **kwargs):
+        if kwargs.get("extra", {}).get("repair"):
+            put_user_routes(aws, "U4", [GINZA])
+            aws.Table(cdh.ROUTE_SUBSCRIBERS_TABLE_NAME).update_item(
+                Key={cdh.ROUTE_INDEX_KEY_NAME: GINZA},
+                UpdateExpression="ADD #subscribers :user",
+                ExpressionAttributeNames={"#subscribers": cdh.SUBSCRIBERS_COLUMN_NAME},
+                ExpressionAttributeValues={":user": {"U4"}},
+            )
+        logger_info(msg, *args, **kwargs)
+
+    monkeypatch.setattr(cdh.logger, "info", save_settings_during_check)
+    cdh.check_route_index(repair=True)
+
+    assert get_subscribers(aws, GINZA) == {"U1", "U4"}
+
+
+def test_get_route_subscribers_falls_back_to_users_table(aws):
+    put_user_routes(aws, "U1", [GINZA, MARUNOUCHI])
+    put_user_routes(aws, "U2", [GINZA])
+    # 丸ノ内線は登録ユーザーが全員解除した状態 (属性の無い項目) とする
+    aws.Table(cdh.ROUTE_SUBSCRIBERS_TABLE_NAME).put_item(
+        Item={cdh.ROUTE_INDEX_KEY_NAME: MARUNOUCHI}
+    )
+
+    subscribers_map = cdh.get_route_subscribers([GINZA, MARUNOUCHI])
+
+    assert subscribers_map == {GINZA: {"U1", "U2"}}
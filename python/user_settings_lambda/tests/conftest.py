@@ -0,0 +1,56 @@
+# -*- coding: utf-8 -*-
+"""user_settings_lambdaのテスト共通設定."""
+
+import os
+import sys
+
+import pytest
+
+# Lambdaの環境変数はモジュール読み込み時に参照されるため、インポート前に設定する
+os.environ.setdefault("AWS_DEFAULT_REGION", "ap-northeast-1")
+os.environ.setdefault("AWS_ACCESS_KEY_ID", "testing")
+os.environ.setdefault("AWS_SECRET_ACCESS_KEY", "testing")
+os.environ.setdefault("LINE_CHANNEL_ID", "1234567890")
+os.environ.setdefault("LINE_CHANNEL_SECRET_PARAM_NAME", "line-channel-secret")
+os.environ.setdefault("USER_TABLE_NAME", "users")
+os.environ.setdefault("ROUTE_SUBSCRIBERS_TABLE_NAME", "route-subscribers")
+os.environ.setdefault("S3_OUTPUT_BUCKET", "train-alert-test")
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture
+def aws(monkeypatch):
+    """motoでDynamoDB・S3をモックし、Lambdaと同じ構成のテーブルを作成する."""
+    moto = pytest.importorskip("moto")
+    import boto3
+
+    import user_settings_lambda as usl
+
+    with moto.mock_aws():
+        # モック開始前に生成したクライアントを使用しないよう、生成済みの登録を破棄する
+        monkeypatch.setattr(usl, "_aws_objects", {})
+        dynamodb = boto3.client("dynamodb")
+        dynamodb.create_table(
+            TableName=usl.USER_TABLE_NAME,
+            KeySchema=[
+                {"AttributeName": "lineUserId", "KeyType": "HASH"},
+                {"AttributeName": "settingOrRoute", "KeyType": "RANGE"},
+            ],
+            AttributeDefinitions=[
+                {"AttributeName": "lineUserId", "AttributeType": "S"},
+                {"AttributeName": "settingOrRoute", "AttributeType": "S"},
+            ],
+            BillingMode="PAY_PER_REQUEST",
+        )
+        dynamodb.create_table(
+            TableName=usl.ROUTE_SUBSCRIBERS_TABLE_NAME,
+            KeySchema=[{"AttributeName": "routeId", "KeyType": "HASH"}],
+            AttributeDefinitions=[{"AttributeName": "routeId", "AttributeType": "S"}],
+            BillingMode="PAY_PER_REQUEST",
+        )
+        boto3.client("s3").create_bucket(
+            Bucket=usl.S3_BUCKET_NAME,
+            CreateBucketConfiguration={"LocationConstraint": "ap-northeast-1"},
+        )
+        yield boto3.resource("dynamodb")
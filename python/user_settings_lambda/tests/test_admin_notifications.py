@@ -0,0 +1,74 @@
+# -*- coding: utf-8 -*-
+"""管理者向けユーザー登録通知 (SQSキュー経由のダイジェスト) のテスト."""
+
+import json
+
+import pytest
+from botocore.exceptions import ClientError
+
+import user_settings_lambda as usl
+
+
+class FakeClient:
+    def __init__(self, error=None):
+        self.calls = []
+        self.error = error
+
+    def _call(self, **kwargs):
+        if self.error:
+            raise ClientError({"Error": {"Code": self.error}}, "Operation")
+        self.calls.append(kwargs)
+
+    send_message = publish = _call
+
+
+@pytest.fixture
+def clients(monkeypatch):
+    clients = {"sqs": FakeClient(), "sns": FakeClient()}
+    monkeypatch.setattr(usl, "get_aws_client", lambda name: clients[name])
+    monkeypatch.setattr(usl, "ADMIN_NOTIFY_QUEUE_URL", "https://sqs.example/queue")
+    return clients
+
+
+def sqs_record(line_user_id, updated_at):
+    body = json.dumps({"lineUserId": line_user_id, "updatedAt": updated_at})
+    return {"eventSource": "aws:sqs", "body": body}
+
+
+def test_queue_sends_message_without_publishing(clients):
+    usl.queue_admin_notification("U1")
+
+    assert len(clients["sqs"].calls) == 1
+    assert json.loads(clients["sqs"].calls[0]["MessageBody"])["lineUserId"] == "U1"
+    assert clients["sns"].calls == []
+
+
+def test_queue_failure_does_not_raise(clients):
+    clients["sqs"].error = "ServiceUnavailable"
+    usl.queue_admin_notification("U1")
+
+
+def test_batch_is_published_as_one_digest_per_user(clients):
+    event = {
+        "Records": [
+            sqs_record("U2", 200.0),
+            sqs_record("U1", 100.0),
+            sqs_record("U2", 300.0),
+        ]
+    }
+
+    assert usl.lambda_handler(event, None) == {"statusCode": 200}
+
+    assert len(clients["sns"].calls) == 1
+    message = clients["sns"].calls[0]["Message"]
+    assert message.splitlines() == [
+        "2人のユーザーが登録/更新されました。",
+        "LINE User ID: U1 (1回)",
+        "LINE User ID: U2 (2回)",
+    ]
+
+
+def test_publish_failure_is_raised_for_sqs_retry(clients):
+    clients["sns"].error = "Throttling"
+    with pytest.raises(ClientError):
+        usl.lambda_handler({"Records": [sqs_record("U1", 100.0)]}, None)
@@ -0,0 +1,59 @@
+# -*- coding: utf-8 -*-
+"""コールドスタート時のモジュール読み込み時間と、遅延インポートのテスト."""
+
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+
+FUNCTION_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MODULE_NAME = "user_settings_lambda"
+# 読み込み時間 (-X importtimeの累計) の上限 (マイクロ秒)
+IMPORT_TIME_BUDGET_US = 150_000
+# 初回の呼び出しまで読み込みを遅らせるモジュール
+LAZY_MODULES = ("boto3", "requests", "jwt")
+RUNS = 3
+
+
+def measure_import():
+    """別プロセスでモジュールを読み込み、累計の読み込み時間と読み込み済みのモジュールを返す."""
+    code = (
+        f"import json, sys; import {MODULE_NAME}; "
+        "print(json.dumps(sorted(sys.modules)))"
+    )
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        cwd=FUNCTION_DIR,
+        env=os.environ.copy(),
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    cumulative_us = None
+    for line in result.stderr.splitlines():
+        # 形式: "import time: <self> | <cumulative> | <モジュール名>"
+        if not line.startswith("import time:"):
+            continue
+        _, cumulative, name = line[len("import time:") :].split("|")
+        if name.strip() == MODULE_NAME:
+            cumulative_us = int(cumulative)
+    return cumulative_us, set(json.loads(result.stdout))
+
+
+@pytest.fixture(scope="module")
+def import_results():
+    # 初回はバイトコードの生成を含むため、複数回計測する
+    return [measure_import() for _ in range(RUNS)]
+
+
+def test_import_time_is_within_budget(import_results):
+    cumulative_us = min(cumulative_us for cumulative_us, _ in import_results)
+    assert cumulative_us is not None
+    assert cumulative_us < IMPORT_TIME_BUDGET_US
+
+
+def test_heavy_modules_are_not_imported(import_results):
+    _, modules = import_results[-1]
+    assert modules.isdisjoint(LAZY_MODULES)
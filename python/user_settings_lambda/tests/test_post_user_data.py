@@ -0,0 +1,155 @@
+# -*- coding: utf-8 -*-
+"""ユーザー設定の保存リクエスト (入力チェックとバージョン条件付きの保存) のテスト."""
+
+import json
+
+import pytest
+
+import user_settings_lambda as usl
+
+
+def invoke(body):
+    raw_body = body if isinstance(body, str) else json.dumps(body)
+    return usl.lambda_handler({"body": raw_body}, None)
+
+
+@pytest.mark.parametrize(
+    "body",
+    [
+        {"lineUserId": "U1", "version": "abc", "routes": []},
+        {"lineUserId": "U1", "version": None, "routes": []},
+        {"lineUserId": "U1", "version": True, "routes": []},
+        {"lineUserId": "U1", "version": -1, "routes": []},
+        {
+            "lineUserId": "U1",
+            "version": 1,
+            "routesToAdd": ["A"],
+            "routesToDelete": ["A"],
+        },
+        {"lineUserId": "U1", "version": 1, "routes": "odpt.Railway:TokyoMetro.Ginza"},
+        {"lineUserId": "U1", "version": 1, "routes": [usl.PROFILE_KEY]},
+        {"lineUserId": "U1", "version": 1, "routes": [f"R{i}" for i in range(50)]},
+        "{not json",
+    ],
+    ids=[
+        "version_not_number",
+        "version_null",
+        "version_bool",
+        "version_negative",
+        "add_delete_overlap",
+        "routes_not_list",
+        "profile_key",
+        "too_many_routes",
+        "invalid_json",
+    ],
+)
+def test_invalid_payload_returns_400(monkeypatch, body):
+    # 入力チェックで拒否されるため、DynamoDBには到達しない
+    monkeypatch.setattr(usl, "get_dynamodb_resource", pytest.fail)
+    response = invoke(body)
+    assert response["statusCode"] == 400
+    assert json.loads(response["body"])["message"]
+
+
+GINZA = "odpt.Railway:TokyoMetro.Ginza"
+MARUNOUCHI = "odpt.Railway:TokyoMetro.Marunouchi"
+HIBIYA = "odpt.Railway:TokyoMetro.Hibiya"
+
+
+def get_user_items(aws, line_user_id):
+    from boto3.dynamodb.conditions import Key
+
+    items = (
+        aws.Table(usl.USER_TABLE_NAME)
+        .query(KeyConditionExpression=Key("lineUserId").eq(line_user_id))
+        .get("Items", [])
+    )
+    profile = next(
+        (item for item in items if item["settingOrRoute"] == usl.PROFILE_KEY), {}
+    )
+    routes = {
+        item["settingOrRoute"]
+        for item in items
+        if item["settingOrRoute"] != usl.PROFILE_KEY
+    }
+    return profile.get(usl.VERSION_ATTRIBUTE_NAME), routes
+
+
+def save(line_user_id, version, base_routes, routes):
+    return usl.post_user_data(
+        {
+            "lineUserId": line_user_id,
+            "version": version,
+            "baseRoutes": base_routes,
+            "routes": routes,
+        }
+    )
+
+
+def test_versioned_save_creates_new_user_at_version_zero(aws):
+    assert save("U1", 0, [], [GINZA, MARUNOUCHI]) == 1
+
+    assert get_user_items(aws, "U1") == (1, {GINZA, MARUNOUCHI})
+
+
+def test_versioned_save_with_matching_version_increments_version(aws):
+    save("U1", 0, [], [GINZA, MARUNOUCHI])
+
+    assert save("U1", 1, [GINZA, MARUNOUCHI], [GINZA, HIBIYA]) == 2
+
+    assert get_user_items(aws, "U1") == (2, {GINZA, HIBIYA})
+
+
+@pytest.mark.parametrize("stale_version", [0, 1])
+def test_versioned_save_with_stale_version_is_rejected(aws, stale_version):
+    save("U1", 0, [], [GINZA])
+    save("U1", 1, [GINZA], [GINZA, MARUNOUCHI])
+
+    # バージョン0 (attribute_not_exists) も、既存ユーザーに対しては競合として拒否される
+    with pytest.raises(usl.VersionConflictError):
+        save("U1", stale_version, [GINZA], [HIBIYA])
+
+    assert get_user_items(aws, "U1") == (2, {GINZA, MARUNOUCHI})
+
+
+def test_stale_version_returns_409(aws, monkeypatch):
+    monkeypatch.setattr(usl, "queue_admin_notification", lambda line_user_id: None)
+    body = {"lineUserId": "U1", "version": 0, "baseRoutes": [], "routes": [GINZA]}
+
+    first = invoke(body)
+    second = invoke(body)
+
+    assert first["statusCode"] == 200
+    assert json.loads(first["body"])["version"] == 1
+    assert second["statusCode"] == 409
+    assert get_user_items(aws, "U1") == (1, {GINZA})
+
+
+def get_subscribers(aws, route_id):
+    item = (
+        aws.Table(usl.ROUTE_SUBSCRIBERS_TABLE_NAME)
+        .get_item(Key={usl.ROUTE_INDEX_KEY_NAME: route_id})
+        .get("Item", {})
+    )
+    return item.get(usl.SUBSCRIBERS_COLUMN_NAME, set())
+
+
+def save_legacy(line_user_id, routes):
+    return usl.post_user_data({"lineUserId": line_user_id, "routes": routes})
+
+
+@pytest.mark.parametrize("versioned", [True, False], ids=["versioned", "legacy"])
+def test_save_updates_route_index(aws, versioned):
+    if versioned:
+        save("U1", 0, [], [GINZA, MARUNOUCHI])
+        save("U2", 0, [], [GINZA])
+        save("U1", 1, [GINZA, MARUNOUCHI], [GINZA, HIBIYA])
+    else:
+        save_legacy("U1", [GINZA, MARUNOUCHI])
+        save_legacy("U2", [GINZA])
+        save_legacy("U1", [GINZA, HIBIYA])
+
+    assert get_subscribers(aws, GINZA) == {"U1", "U2"}
+    # 登録ユーザーが全員解除した路線は、subscribersの無い項目として残る
+    assert get_subscribers(aws, MARUNOUCHI) == set()
+    assert get_subscribers(aws, HIBIYA) == {"U1"}
@@ -0,0 +1,124 @@
+# -*- coding: utf-8 -*-
+"""verify_id_tokenのテスト (ローカルで生成した鍵で署名したIDトークンを検証する)."""
+
+import json
+import time
+
+import jwt
+import pytest
+from cryptography.hazmat.primitives.asymmetric import ec
+
+import user_settings_lambda as usl
+
+CHANNEL_SECRET = "0123456789abcdef0123456789abcdef"
+
+
+def make_claims(**overrides):
+    now = int(time.time())
+    claims = {
+        "iss": usl.LINE_ISSUER,
+        "sub": "U0123456789abcdef",
+        "aud": usl.LINE_CHANNEL_ID,
+        "exp": now + 600,
+        "iat": now,
+    }
+    claims.update(overrides)
+    return claims
+
+
+def make_jwk(private_key, kid):
+    jwk = json.loads(jwt.algorithms.ECAlgorithm.to_jwk(private_key.public_key()))
+    jwk.update({"kid": kid, "alg": "ES256", "use": "sig"})
+    return jwk
+
+
+@pytest.fixture(autouse=True)
+def channel_secret(monkeypatch):
+    monkeypatch.setattr(usl, "get_line_channel_secret", lambda: CHANNEL_SECRET)
+    monkeypatch.setattr(usl, "_jwks_client", None)
+
+
+@pytest.fixture
+def jwks(monkeypatch):
+    """JWKSエンドポイントの代わりに、テストで登録した鍵を返すスタブ."""
+    state = {"keys": [], "fetch_count": 0}
+
+    def fetch_data(self):
+        state["fetch_count"] += 1
+        return {"keys": list(state["keys"])}
+
+    monkeypatch.setattr(jwt.PyJWKClient, "fetch_data", fetch_data)
+    return state
+
+
+def test_hs256_signed_with_channel_secret_is_accepted():
+    token = jwt.encode(make_claims(), CHANNEL_SECRET, algorithm="HS256")
+    assert usl.verify_id_token(token) == "U0123456789abcdef"
+
+
+def test_hs256_signed_with_other_secret_is_rejected():
+    token = jwt.encode(
+        make_claims(), "fedcba9876543210fedcba9876543210", algorithm="HS256"
+    )
+    with pytest.raises(ValueError):
+        usl.verify_id_token(token)
+
+
+def test_es256_signed_with_jwks_key_is_accepted(jwks):
+    private_key = ec.generate_private_key(ec.SECP256R1())
+    jwks["keys"].append(make_jwk(private_key, "key-1"))
+    token = jwt.encode(
+        make_claims(), private_key, algorithm="ES256", headers={"kid": "key-1"}
+    )
+
+    assert usl.verify_id_token(token) == "U0123456789abcdef"
+    # 2回目以降はキャッシュしたJWKSを使用する
+    assert usl.verify_id_token(token) == "U0123456789abcdef"
+    assert jwks["fetch_count"] == 1
+
+
+def test_es256_with_unknown_kid_refetches_jwks(jwks):
+    old_key = ec.generate_private_key(ec.SECP256R1())
+    jwks["keys"].append(make_jwk(old_key, "key-1"))
+    usl.verify_id_token(
+        jwt.encode(make_claims(), old_key, algorithm="ES256", headers={"kid": "key-1"})
+    )
+
+    # 鍵のローテーション後、キャッシュにないkidのトークンはJWKSを取得し直して検証する
+    new_key = ec.generate_private_key(ec.SECP256R1())
+    jwks["keys"].append(make_jwk(new_key, "key-2"))
+    token = jwt.encode(
+        make_claims(), new_key, algorithm="ES256", headers={"kid": "key-2"}
+    )
+
+    assert usl.verify_id_token(token) == "U0123456789abcdef"
+    assert jwks["fetch_count"] == 2
+
+
+@pytest.mark.parametrize(
+    "overrides",
+    [
+        {"aud": "9999999999"},
+        {"iss": "https://example.com"},
+        {"exp": int(time.time()) - usl.ID_TOKEN_LEEWAY - 60},
+    ],
+    ids=["wrong_aud", "wrong_iss", "expired"],
+)
+def test_invalid_claims_are_rejected(overrides):
+    token = jwt.encode(make_claims(**overrides), CHANNEL_SECRET, algorithm="HS256")
+    with pytest.raises(ValueError):
+        usl.verify_id_token(token)
+
+
+def test_missing_sub_is_rejected():
+    claims = make_claims()
+    del claims["sub"]
+    token = jwt.encode(claims, CHANNEL_SECRET, algorithm="HS256")
+    with pytest.raises(ValueError):
+        usl.verify_id_token(token)
+
+
+def test_alg_none_is_rejected():
+    token = jwt.encode(make_claims(), None, algorithm="none")
+    with pytest.raises(ValueError):
+        usl.verify_id_token(token)
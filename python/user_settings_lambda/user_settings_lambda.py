@@ -6,14 +6,15 @@
 ユーザー情報の取得、および登録路線の更新処理を行う。
 """
 
+import functools
 import json
 import logging
 import os
-from typing import Any, Dict, List, Optional
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional
 
-import boto3
-import requests
-from boto3.dynamodb.conditions import Key
+# boto3・requests・jwtはインポートに時間がかかるため、初回使用時にインポートする
 from botocore.exceptions import ClientError
 
 # --- ログ設定 ---
@@ -25,40 +26,178 @@ logger.setLevel(LOG_LEVEL)
 LINE_CHANNEL_ID = os.environ.get("LINE_CHANNEL_ID")
 LINE_CHANNEL_SECRET_PARAM_NAME = os.environ.get("LINE_CHANNEL_SECRET_PARAM_NAME")
 USER_TABLE_NAME = os.environ.get("USER_TABLE_NAME")
+# 路線ID -> 登録ユーザーIDのセットを保持する転置インデックスのテーブル
+ROUTE_SUBSCRIBERS_TABLE_NAME = os.environ.get("ROUTE_SUBSCRIBERS_TABLE_NAME")
 FRONTEND_REDIRECT_URL = os.environ.get("FRONTEND_REDIRECT_URL")
 S3_BUCKET_NAME = os.environ.get("S3_OUTPUT_BUCKET")
 USER_LIST_FILE_KEY = "user-list.json"
 SNS_TOPIC_ARN = os.environ.get("SNS_TOPIC_ARN")
+# 管理者向けのユーザー登録通知を積むSQSキュー (未設定の場合は保存ごとにSNSへ直接発行する)
+ADMIN_NOTIFY_QUEUE_URL = os.environ.get("ADMIN_NOTIFY_QUEUE_URL")
 RESPONSE_TIMEOUT = int(os.environ.get("RESPONSE_TIMEOUT", 10))
+# LINEの公開鍵(JWKS)をキャッシュする秒数。鍵のローテーションは未知のkidで再取得して追従する。
+JWKS_CACHE_TTL = int(os.environ.get("JWKS_CACHE_TTL", 86400))
+# IDトークンの有効期限判定で許容する時計のずれ（秒）
+ID_TOKEN_LEEWAY = 30
 
 LINE_TOKEN_URL = "https://api.line.me/oauth2/v2.1/token"
-LINE_VERIFY_URL = "https://api.line.me/oauth2/v2.1/verify"
+LINE_JWKS_URL = "https://api.line.me/oauth2/v2.1/certs"
+LINE_ISSUER = "https://access.line.me"
 PROFILE_KEY = "#PROFILE#"
+# 楽観的ロックに使用するプロフィール項目のバージョン属性
+VERSION_ATTRIBUTE_NAME = "version"
+MAX_TRANSACT_ITEMS = 100  # DynamoDBのTransactWriteItemsで扱える最大項目数
+ROUTE_INDEX_KEY_NAME = "routeId"  # 転置インデックスのパーティションキー
+SUBSCRIBERS_COLUMN_NAME = "subscribers"  # 登録ユーザーIDのセットを格納する属性
+
+# --- Boto3クライアント設定 ---
+# クライアントは初回使用時に生成し、ウォームスタート間で再利用する
+# (不正なリクエストなど、AWSを使用しない処理でのコールドスタート時間を短縮するため)
+AWS_MAX_POOL_CONNECTIONS = int(os.environ.get("AWS_MAX_POOL_CONNECTIONS", 10))
+AWS_CONNECT_TIMEOUT = 2
+AWS_READ_TIMEOUT = 10
+AWS_MAX_ATTEMPTS = 3
+
+_aws_lock = threading.RLock()
+_aws_objects: Dict[str, Any] = {}
+
+
+def _get_aws_object(name: str, factory: Callable[[], Any]) -> Any:
+    """生成済みのクライアント・リソースを返す。未生成の場合はfactoryで生成して登録する。"""
+    aws_object = _aws_objects.get(name)
+    if aws_object is None:
+        # boto3のセッションはスレッドセーフではないため、生成処理はロック内で行う
+        with _aws_lock:
+            aws_object = _aws_objects.get(name)
+            if aws_object is None:
+                aws_object = factory()
+                _aws_objects[name] = aws_object
+    return aws_object
+
+
+def _get_boto_config() -> Any:
+    """全クライアントで共有するbotocoreの設定を返す。"""
+    from botocore.config import Config
+
+    return Config(
+        max_pool_connections=AWS_MAX_POOL_CONNECTIONS,
+        connect_timeout=AWS_CONNECT_TIMEOUT,
+        read_timeout=AWS_READ_TIMEOUT,
+        retries={"max_attempts": AWS_MAX_ATTEMPTS, "mode": "standard"},
+    )
 
-ssm_client = boto3.client("ssm")
-s3_client = boto3.client("s3")
-sns_client = boto3.client("sns")
-dynamodb = boto3.resource("dynamodb")
-table = dynamodb.Table(USER_TABLE_NAME)
 
-try:
-    # SSMパラメータストアからLINEチャネルシークレットを取得
-    response = ssm_client.get_parameter(
-        Name=LINE_CHANNEL_SECRET_PARAM_NAME, WithDecryption=True
-    )
-    LINE_CHANNEL_SECRET = response["Parameter"]["Value"]
-except ClientError:
-    logger.critical(
-        f"パラメータ {LINE_CHANNEL_SECRET_PARAM_NAME} の取得に失敗しました。",
-        exc_info=True,
-    )
-    raise RuntimeError(
-        "Lambdaの初期化に失敗しました: LINEチャネルシークレットが取得できません。"
+def get_aws_client(service_name: str) -> Any:
+    """指定したサービスのBoto3クライアントを返す。"""
+
+    def create_client() -> Any:
+        import boto3
+
+        return boto3.client(service_name, config=_get_boto_config())
+
+    return _get_aws_object(service_name, create_client)
+
+
+def get_dynamodb_resource() -> Any:
+    """DynamoDBのBoto3リソースを返す。"""
+
+    def create_resource() -> Any:
+        import boto3
+
+        return boto3.resource("dynamodb", config=_get_boto_config())
+
+    return _get_aws_object("dynamodb-resource", create_resource)
+
+
+def get_user_table() -> Any:
+    """UsersテーブルのBoto3 Tableオブジェクトを返す。"""
+    return _get_aws_object(
+        "user-table", lambda: get_dynamodb_resource().Table(USER_TABLE_NAME)
     )
 
 
+@functools.lru_cache(maxsize=None)
+def get_line_channel_secret() -> str:
+    """SSMパラメータストアからLINEチャネルシークレットを取得する (初回のみ読み込む)。"""
+    try:
+        response = get_aws_client("ssm").get_parameter(
+            Name=LINE_CHANNEL_SECRET_PARAM_NAME, WithDecryption=True
+        )
+        return response["Parameter"]["Value"]
+    except ClientError:
+        logger.critical(
+            f"パラメータ {LINE_CHANNEL_SECRET_PARAM_NAME} の取得に失敗しました。",
+            exc_info=True,
+        )
+        raise RuntimeError("LINEチャネルシークレットが取得できません。")
+
+
+class VersionConflictError(Exception):
+    """保存リクエストのバージョンがDynamoDB上の最新バージョンと一致しない場合の例外。"""
+
+
+class InvalidRequestError(ValueError):
+    """リクエストボディの内容が不正な場合の例外 (400を返す)。"""
+
+
+# JWKSクライアントはウォームスタート間で再利用し、取得した公開鍵をキャッシュする
+_jwks_client: Optional[Any] = None
+
+
+def get_jwks_client() -> Any:
+    """LINEの公開鍵(JWKS)を取得・キャッシュするクライアント(jwt.PyJWKClient)を返す。"""
+    global _jwks_client
+    if _jwks_client is None:
+        import jwt
+
+        _jwks_client = jwt.PyJWKClient(
+            LINE_JWKS_URL,
+            cache_jwk_set=True,
+            lifespan=JWKS_CACHE_TTL,
+            timeout=RESPONSE_TIMEOUT,
+        )
+    return _jwks_client
+
+
+def verify_id_token(id_token: str) -> str:
+    """IDトークンの署名・発行元・対象者・有効期限をローカルで検証し、ユーザーIDを返す。
+
+    ウェブログインで発行されるIDトークンはチャネルシークレットによるHS256、
+    それ以外はLINEが公開するJWKSの鍵によるES256で署名されているため、
+    ヘッダーのalgに応じて検証鍵を切り替える。
+    """
+    import jwt
+
+    try:
+        header = jwt.get_unverified_header(id_token)
+        algorithm = header.get("alg")
+        if algorithm == "HS256":
+            key = get_line_channel_secret()
+        elif algorithm == "ES256":
+            key = get_jwks_client().get_signing_key(header.get("kid")).key
+        else:
+            raise ValueError(f"サポートされていない署名アルゴリズムです: {algorithm}")
+
+        claims = jwt.decode(
+            id_token,
+            key,
+            algorithms=[algorithm],
+            audience=LINE_CHANNEL_ID,
+            issuer=LINE_ISSUER,
+            leeway=ID_TOKEN_LEEWAY,
+            options={"require": ["exp", "iat", "iss", "aud", "sub"]},
+        )
+    except jwt.PyJWTError as e:
+        logger.error(f"IDトークンの検証に失敗しました: {e}", exc_info=True)
+        raise ValueError("IDトークンの検証に失敗しました。") from e
+
+    return claims["sub"]
+
+
 def get_line_user_id(body: Dict[str, Any]) -> str:
     """リクエストボディから認可コードを抽出し、LINE APIを介してユーザーIDを取得する。"""
+    import requests
+
     auth_code = body.get("authorizationCode")
     if not auth_code:
         raise ValueError("認可コードが必要です。")
@@ -72,7 +211,7 @@ def get_line_user_id(body: Dict[str, Any]) -> str:
             "code": auth_code,
             "redirect_uri": FRONTEND_REDIRECT_URL,
             "client_id": LINE_CHANNEL_ID,
-            "client_secret": LINE_CHANNEL_SECRET,
+            "client_secret": get_line_channel_secret(),
         },
         timeout=10,  # タイムアウト設定
     )
@@ -91,23 +230,8 @@ def get_line_user_id(body: Dict[str, Any]) -> str:
     if not id_token:
         raise ValueError("IDトークンの抽出に失敗しました。")
 
-    # LINE検証APIを呼び出し、IDトークンを検証してユーザーIDを取得
-    verify_response = requests.post(
-        LINE_VERIFY_URL,
-        data={"id_token": id_token, "client_id": LINE_CHANNEL_ID},
-        timeout=10,  # タイムアウト設定
-    )
-    if not verify_response.ok:
-        logger.error(
-            "LINE検証APIからの応答でエラーが発生しました。",
-            extra={
-                "status_code": verify_response.status_code,
-                "response_body": verify_response.text,
-            },
-        )
-    verify_response.raise_for_status()
-    verify_json = verify_response.json()
-    line_user_id = verify_json.get("sub")
+    # IDトークンをローカルで検証してユーザーIDを取得
+    line_user_id = verify_id_token(id_token)
     if not line_user_id:
         raise ValueError("LINEユーザーIDの取得に失敗しました。")
     return line_user_id
@@ -115,6 +239,8 @@ def get_line_user_id(body: Dict[str, Any]) -> str:
 
 def get_user_data(line_user_id: str) -> Optional[Dict[str, Any]]:
     """DynamoDBからユーザーのプロフィールと登録路線を取得し、整形して返す。"""
+    from boto3.dynamodb.conditions import Key
+
     try:
         # railway_list.jsonを読み込んで、IDと路線のマッピングを作成
         # NOTE: 毎回ファイルを読み込むが、キャッシュを考慮する場合、グローバルスコープでの読み込みを検討。
@@ -122,7 +248,7 @@ def get_user_data(line_user_id: str) -> Optional[Dict[str, Any]]:
             railway_list = json.load(f)
         railway_map = {item["odpt:railway"]: item["route"] for item in railway_list}
 
-        response = table.query(
+        response = get_user_table().query(
             KeyConditionExpression=Key("lineUserId").eq(line_user_id)
         )
         items = response.get("Items", [])
@@ -143,6 +269,9 @@ def get_user_data(line_user_id: str) -> Optional[Dict[str, Any]]:
         user_data = {
             "lineUserId": user_profile.get("lineUserId"),
             "routes": sorted(routes),
+            # 保存時の差分計算と競合検出のため、路線IDとバージョンも返す
+            "routeIds": sorted(route_ids),
+            "version": int(user_profile.get(VERSION_ATTRIBUTE_NAME, 0)),
         }
         return user_data
     except (ClientError, FileNotFoundError) as e:
@@ -156,7 +285,7 @@ def get_user_data(line_user_id: str) -> Optional[Dict[str, Any]]:
 def get_s3_object_as_list(bucket_name: str, key: str) -> List[str]:
     """S3から指定されたJSONオブジェクトを読み込み、リストとして返す。"""
     try:
-        response_s3file = s3_client.get_object(Bucket=bucket_name, Key=key)
+        response_s3file = get_aws_client("s3").get_object(Bucket=bucket_name, Key=key)
         content_string = response_s3file["Body"].read().decode("utf-8")
 
         if not content_string.strip():
@@ -188,12 +317,22 @@ def get_s3_object_as_list(bucket_name: str, key: str) -> List[str]:
         return []
 
 
-def post_user_data(user_data: Dict[str, Any]):
-    """ユーザーデータをDynamoDBに差分更新で保存する。"""
+def post_user_data(user_data: Dict[str, Any]) -> int:
+    """ユーザーデータをDynamoDBに差分更新で保存し、保存後のバージョンを返す。
+
+    リクエストに'version'が含まれていれば読み取りなしの条件付きトランザクションで保存する。
+    含まれていない場合は、既存データを読み取って差分を計算する従来の方式で保存する。
+    従来の方式では転置インデックスの更新はベストエフォートとなる。
+    """
+    from boto3.dynamodb.conditions import Key
+
+    if VERSION_ATTRIBUTE_NAME in user_data:
+        return post_user_data_versioned(user_data)
+
     line_user_id = user_data["lineUserId"]
     try:
         # 1. 既存の路線データを取得
-        response = table.query(
+        response = get_user_table().query(
             KeyConditionExpression=Key("lineUserId").eq(line_user_id)
         )
         existing_items = response.get("Items", [])
@@ -204,18 +343,13 @@ def post_user_data(user_data: Dict[str, Any]):
         }
 
         # 2. 新しい路線データと差分を計算
-        new_routes = set(
-            user_data.get("routes", [])
-        )  # フロントエンドからは路線IDのリストが来ることを想定
+        # フロントエンドからは路線IDのリストが来ることを想定
+        new_routes = get_route_set(user_data, "routes")
         routes_to_add = new_routes - old_routes
         routes_to_delete = old_routes - new_routes
 
         # 3. BatchWriterを使って、差分のみを更新
-        with table.batch_writer() as batch:
-            # プロフィール情報は常に上書き更新
-            profile_item = {"lineUserId": line_user_id, "settingOrRoute": PROFILE_KEY}
-            batch.put_item(Item=profile_item)
-
+        with get_user_table().batch_writer() as batch:
             # 追加された路線を登録
             for route in routes_to_add:
                 batch.put_item(
@@ -228,23 +362,205 @@ def post_user_data(user_data: Dict[str, Any]):
                     Key={"lineUserId": line_user_id, "settingOrRoute": route}
                 )
 
-        # 路線情報に変更があった場合のみS3に通知 (user-list.jsonにユーザーIDを追記)
-        if routes_to_add or routes_to_delete:
-            logger.info(
-                f"ユーザー'{line_user_id}'の路線情報が変更されました。S3のフラグファイルを更新します。"
-            )
-            s3_update_user_list(line_user_id)
-        else:
-            logger.info(
-                f"ユーザー'{line_user_id}'の路線情報に変更がないため、S3フラグファイルの更新はスキップします。"
-            )
+        # 転置インデックスに路線の追加・削除を反映 (トランザクション外のため、途中で失敗した
+        # 場合の不整合はcheck_delay_handlerのcheck_route_indexで修復する)
+        for route_index_update in build_route_index_updates(
+            line_user_id, routes_to_add, routes_to_delete
+        ):
+            get_dynamodb_resource().meta.client.update_item(**route_index_update)
+
+        # プロフィール情報のバージョンを進め、バージョン付きの保存と整合させる
+        response = get_user_table().update_item(
+            Key={"lineUserId": line_user_id, "settingOrRoute": PROFILE_KEY},
+            UpdateExpression="ADD #version :one",
+            ExpressionAttributeNames={"#version": VERSION_ATTRIBUTE_NAME},
+            ExpressionAttributeValues={":one": 1},
+            ReturnValues="UPDATED_NEW",
+        )
+        new_version = int(response["Attributes"][VERSION_ATTRIBUTE_NAME])
+
+        notify_route_change(line_user_id, routes_to_add, routes_to_delete)
+        return new_version
+
+    except ClientError as e:
+        logger.error(
+            f"DynamoDBへのユーザーデータ登録でエラーが発生しました: {e}", exc_info=True
+        )
+        raise
+
+
+def post_user_data_versioned(user_data: Dict[str, Any]) -> int:
+    """クライアントが送信した差分を、バージョン条件付きの単一トランザクションで保存する。
 
+    差分は'routesToAdd'/'routesToDelete'で直接指定するか、前回取得時の路線ID
+    ('baseRoutes')と保存する路線ID('routes')から計算する。プロフィール項目の
+    バージョンが'version'と一致しない場合は、古い画面からの保存とみなして拒否する。
+
+    Raises:
+        InvalidRequestError: バージョンや差分の内容が不正な場合。
+        VersionConflictError: バージョンが一致せず保存が拒否された場合。
+    """
+    line_user_id = user_data["lineUserId"]
+    expected_version = user_data[VERSION_ATTRIBUTE_NAME]
+    # boolはintのサブクラスのため、明示的に除外する
+    if (
+        isinstance(expected_version, bool)
+        or not isinstance(expected_version, int)
+        or expected_version < 0
+    ):
+        raise InvalidRequestError("バージョンには0以上の整数を指定してください。")
+
+    if "routesToAdd" in user_data or "routesToDelete" in user_data:
+        routes_to_add = get_route_set(user_data, "routesToAdd")
+        routes_to_delete = get_route_set(user_data, "routesToDelete")
+    else:
+        base_routes = get_route_set(user_data, "baseRoutes")
+        new_routes = get_route_set(user_data, "routes")
+        routes_to_add = new_routes - base_routes
+        routes_to_delete = base_routes - new_routes
+
+    if routes_to_add & routes_to_delete:
+        raise InvalidRequestError(
+            "同じ路線を追加と削除の両方に指定することはできません。"
+        )
+    if PROFILE_KEY in routes_to_add | routes_to_delete:
+        raise InvalidRequestError("不正な路線IDが含まれています。")
+    # プロフィール1件と、路線ごとのUsersテーブル・転置インデックスの2件を書き込む
+    if 2 * (len(routes_to_add) + len(routes_to_delete)) + 1 > MAX_TRANSACT_ITEMS:
+        raise InvalidRequestError("一度に更新できる路線数の上限を超えています。")
+
+    # プロフィール項目のバージョンを条件に、路線の追加・削除をまとめて書き込む
+    # (リソース経由のクライアントのため、属性値はPythonの型のまま指定できる)
+    if expected_version == 0:
+        condition = "attribute_not_exists(#version)"
+        condition_values = {}
+    else:
+        condition = "#version = :expected"
+        condition_values = {":expected": expected_version}
+
+    new_version = expected_version + 1
+    transact_items = [
+        {
+            "Update": {
+                "TableName": USER_TABLE_NAME,
+                "Key": {
+                    "lineUserId": line_user_id,
+                    "settingOrRoute": PROFILE_KEY,
+                },
+                "UpdateExpression": "SET #version = :next",
+                "ConditionExpression": condition,
+                "ExpressionAttributeNames": {"#version": VERSION_ATTRIBUTE_NAME},
+                "ExpressionAttributeValues": {
+                    ":next": new_version,
+                    **condition_values,
+                },
+            }
+        }
+    ]
+    for route in routes_to_add:
+        transact_items.append(
+            {
+                "Put": {
+                    "TableName": USER_TABLE_NAME,
+                    "Item": {
+                        "lineUserId": line_user_id,
+                        "settingOrRoute": route,
+                    },
+                }
+            }
+        )
+    for route in routes_to_delete:
+        transact_items.append(
+            {
+                "Delete": {
+                    "TableName": USER_TABLE_NAME,
+                    "Key": {
+                        "lineUserId": line_user_id,
+                        "settingOrRoute": route,
+                    },
+                }
+            }
+        )
+    # 転置インデックスの更新も同じトランザクションに含め、Usersテーブルと常に一致させる
+    for route_index_update in build_route_index_updates(
+        line_user_id, routes_to_add, routes_to_delete
+    ):
+        transact_items.append({"Update": route_index_update})
+
+    try:
+        get_dynamodb_resource().meta.client.transact_write_items(
+            TransactItems=transact_items
+        )
     except ClientError as e:
+        if e.response["Error"]["Code"] == "TransactionCanceledException":
+            reasons = e.response.get("CancellationReasons", [])
+            if reasons and reasons[0].get("Code") == "ConditionalCheckFailed":
+                logger.warning(
+                    f"ユーザー'{line_user_id}'の保存はバージョン不一致のため拒否されました。",
+                    extra={
+                        "line_user_id": line_user_id,
+                        "expected_version": expected_version,
+                    },
+                )
+                raise VersionConflictError(
+                    "設定が他の画面で更新されています。再読み込みしてください。"
+                ) from e
         logger.error(
             f"DynamoDBへのユーザーデータ登録でエラーが発生しました: {e}", exc_info=True
         )
         raise
 
+    notify_route_change(line_user_id, routes_to_add, routes_to_delete)
+    return new_version
+
+
+def get_route_set(user_data: Dict[str, Any], name: str) -> set:
+    """リクエストボディから路線IDのリストを取り出し、セットとして返す。
+
+    Raises:
+        InvalidRequestError: 値が路線ID(文字列)のリストでない場合。
+    """
+    routes = user_data.get(name, [])
+    if not isinstance(routes, list) or not all(
+        isinstance(route, str) and route for route in routes
+    ):
+        raise InvalidRequestError(f"'{name}'には路線IDのリストを指定してください。")
+    return set(routes)
+
+
+def build_route_index_updates(
+    line_user_id: str, routes_to_add: set, routes_to_delete: set
+) -> List[Dict[str, Any]]:
+    """転置インデックス(路線ID -> 登録ユーザーIDのセット)を差分更新するパラメータを生成する。"""
+    updates = []
+    for routes, operation in ((routes_to_add, "ADD"), (routes_to_delete, "DELETE")):
+        for route in routes:
+            updates.append(
+                {
+                    "TableName": ROUTE_SUBSCRIBERS_TABLE_NAME,
+                    "Key": {ROUTE_INDEX_KEY_NAME: route},
+                    "UpdateExpression": f"{operation} #subscribers :user",
+                    "ExpressionAttributeNames": {
+                        "#subscribers": SUBSCRIBERS_COLUMN_NAME
+                    },
+                    "ExpressionAttributeValues": {":user": {line_user_id}},
+                }
+            )
+    return updates
+
+
+def notify_route_change(line_user_id: str, routes_to_add: set, routes_to_delete: set):
+    """路線情報に変更があった場合のみS3に通知する (user-list.jsonにユーザーIDを追記)。"""
+    if routes_to_add or routes_to_delete:
+        logger.info(
+            f"ユーザー'{line_user_id}'の路線情報が変更されました。S3のフラグファイルを更新します。"
+        )
+        s3_update_user_list(line_user_id)
+    else:
+        logger.info(
+            f"ユーザー'{line_user_id}'の路線情報に変更がないため、S3フラグファイルの更新はスキップします。"
+        )
+
 
 def s3_update_user_list(line_user_id: str):
     """S3のuser-list.jsonにユーザーIDが存在しない場合、追記してファイルを更新する。"""
@@ -253,7 +569,7 @@ def s3_update_user_list(line_user_id: str):
 
         if line_user_id not in user_list:
             user_list.append(line_user_id)
-            s3_client.put_object(
+            get_aws_client("s3").put_object(
                 Bucket=S3_BUCKET_NAME,
                 Key=USER_LIST_FILE_KEY,
                 Body=json.dumps(user_list, indent=2, ensure_ascii=False),
@@ -273,15 +589,92 @@ def s3_update_user_list(line_user_id: str):
         # DynamoDBへの保存は成功しているので、ここでは例外を再送出しない
 
 
+def queue_admin_notification(line_user_id: str):
+    """管理者向けのユーザー登録通知をSQSキューに送信する。
+
+    キューのメッセージはイベントソースマッピングにより、一定件数または一定時間ごとに
+    まとめてlambda_handlerに渡され、handle_admin_notification_batchでダイジェストとして
+    SNSに発行される。
+    通知は設定の保存に必須ではないため、送信に失敗しても例外は送出しない。
+    """
+    now = time.time()
+    try:
+        if not ADMIN_NOTIFY_QUEUE_URL:
+            publish_admin_digest({line_user_id: {"count": 1, "first_at": now}})
+            return
+        get_aws_client("sqs").send_message(
+            QueueUrl=ADMIN_NOTIFY_QUEUE_URL,
+            MessageBody=json.dumps({"lineUserId": line_user_id, "updatedAt": now}),
+        )
+    except ClientError as e:
+        logger.error(f"管理者通知の送信に失敗しました: {e}", exc_info=True)
+
+
+def handle_admin_notification_batch(records: List[Dict[str, Any]]):
+    """SQSから受け取った管理者通知をユーザー単位で集約し、ダイジェストを発行する。
+
+    発行に失敗した場合は例外を送出し、バッチ全体をSQSに再試行させる。
+    """
+    pending: Dict[str, Dict[str, Any]] = {}
+    for record in records:
+        message = json.loads(record["body"])
+        entry = pending.setdefault(
+            message["lineUserId"], {"count": 0, "first_at": message["updatedAt"]}
+        )
+        entry["count"] += 1
+        entry["first_at"] = min(entry["first_at"], message["updatedAt"])
+
+    if pending:
+        publish_admin_digest(pending)
+
+
+def publish_admin_digest(pending: Dict[str, Dict[str, Any]]):
+    """集約したユーザー登録通知を1通のダイジェストとしてSNSに発行する。
+
+    Raises:
+        ClientError: SNSへの発行に失敗した場合。
+    """
+    lines = [
+        f"LINE User ID: {user_id} ({entry['count']}回)"
+        for user_id, entry in sorted(
+            pending.items(), key=lambda item: item[1]["first_at"]
+        )
+    ]
+    message = f"{len(pending)}人のユーザーが登録/更新されました。\n" + "\n".join(lines)
+    subject = "【Train Delay Alert】ユーザー登録通知"
+    try:
+        get_aws_client("sns").publish(
+            TopicArn=SNS_TOPIC_ARN, Message=message, Subject=subject
+        )
+        logger.info(
+            "SNSにユーザー登録通知のダイジェストを送信しました。",
+            extra={"user_count": len(pending)},
+        )
+    except ClientError as e:
+        logger.error(f"SNSへの通知送信に失敗しました: {e}", exc_info=True)
+        raise
+
+
 def lambda_handler(event: Dict[str, Any], context: object) -> Dict[str, Any]:
     """Lambda関数のメインハンドラ。
 
     リクエストボディに'authorizationCode'が含まれていればLINEログイン処理、
     'lineUserId'が含まれていればユーザーデータの更新処理を行う。
     それ以外は不正なリクエストとして扱う。
+    SQSからのイベントの場合は、管理者向け通知のダイジェストを発行する。
     """
+    records = event.get("Records") or []
+    if records and records[0].get("eventSource") == "aws:sqs":
+        handle_admin_notification_batch(records)
+        return {"statusCode": 200}
+
     try:
-        body = json.loads(event.get("body") or "{}")
+        try:
+            body = json.loads(event.get("body") or "{}")
+        except json.JSONDecodeError as e:
+            raise InvalidRequestError(
+                "リクエストボディがJSON形式ではありません。"
+            ) from e
         logger.info("Received event", extra={"event_body": body})
 
         if "authorizationCode" in body:
@@ -299,6 +692,8 @@ def lambda_handler(event: Dict[str, Any], context: object) -> Dict[str, Any]:
                 user_data = {
                     "lineUserId": line_user_id,
                     "routes": [],
+                    "routeIds": [],
+                    "version": 0,
                 }
             logger.info(
                 "ユーザーデータの取得/作成に成功しました。レスポンスを返します。",
@@ -309,32 +704,38 @@ def lambda_handler(event: Dict[str, Any], context: object) -> Dict[str, Any]:
                 "body": json.dumps(user_data, ensure_ascii=False, default=str),
             }
         elif "lineUserId" in body:
-            post_user_data(body)
+            new_version = post_user_data(body)
             line_user_id = body.get("lineUserId")
             logger.info(
                 f"ユーザー情報を更新しました: {line_user_id}",
                 extra={"line_user_id": line_user_id},
             )
 
-            # SNSにユーザー登録通知を送信
-            try:
-                message = f"新しいユーザーが登録/更新されました。\nLINE User ID: {line_user_id}"
-                subject = "【Train Delay Alert】ユーザー登録通知"
-                sns_client.publish(
-                    TopicArn=SNS_TOPIC_ARN, Message=message, Subject=subject
-                )
-                logger.info("SNSにユーザー登録通知を送信しました。")
-            except ClientError as e:
-                logger.error(f"SNSへの通知送信に失敗しました: {e}", exc_info=True)
+            # 管理者向けのユーザー登録通知はキューに積み、ダイジェストとしてまとめて送信
+            queue_admin_notification(line_user_id)
 
+            response_body = {**body, VERSION_ATTRIBUTE_NAME: new_version}
             return {
                 "statusCode": 200,
-                "body": json.dumps(body, ensure_ascii=False, default=str),
+                "body": json.dumps(response_body, ensure_ascii=False, default=str),
             }
         else:
             error_message = "不正なリクエストです。'authorizationCode'または'lineUserId'が含まれていません。"
             logger.error(error_message, extra={"event_body": body})
             return {"statusCode": 400, "body": json.dumps({"message": error_message})}
+    except InvalidRequestError as e:
+        logger.warning(
+            f"リクエストの内容が不正です: {e}", extra={"event_body": event.get("body")}
+        )
+        return {
+            "statusCode": 400,
+            "body": json.dumps({"message": str(e)}, ensure_ascii=False),
+        }
+    except VersionConflictError as e:
+        return {
+            "statusCode": 409,
+            "body": json.dumps({"message": str(e)}, ensure_ascii=False),
+        }
     except Exception as e:
         logger.critical("予期せぬエラーが発生しました", exc_info=True)
         return {
@@ -97,3 +97,85 @@ resource "aws_dynamodb_table" "train_status" {
     Name = "${local.name_prefix}-train-status"
   })
 }
+
+# -----------------------------------------------------------------------------
+# Route Subscribers Table
+# -----------------------------------------------------------------------------
+# 路線IDごとに、その路線を登録しているユーザーIDのセットを保持する転置インデックスです。
+# user_settings_lambdaが路線の追加・削除と同じトランザクションで更新し、
+# check_delay_lambdaは遅延が発生した路線の登録ユーザーをBatchGetItemで一括取得します。
+# 既存ユーザーの分は、デプロイ後に {"action": "check_route_index", "repair": true} で構築します。
+# 項目サイズの上限 (400 KB) により、1路線あたりの登録ユーザーは約1万人が上限です。
+resource "aws_dynamodb_table" "route_subscribers" {
+  name         = "${local.name_prefix}-route-subscribers"
+  billing_mode = "PAY_PER_REQUEST"
+  hash_key     = "routeId" # パーティションキー: 路線ID (odpt:railway)
+
+  # 誤削除防止
+  deletion_protection_enabled = true
+
+  attribute {
+    name = "routeId"
+    type = "S"
+  }
+
+  server_side_encryption {
+    enabled = true
+  }
+
+  tags = merge(local.tags, {
+    Name = "${local.name_prefix}-route-subscribers"
+  })
+}
+
+# -----------------------------------------------------------------------------
+# Notification Outbox Table
+# -----------------------------------------------------------------------------
+# 遅延検知で生成した通知を、配信が完了するまで保持します。
+# 1通知 = (路線, メッセージのハッシュ, ユーザー) の1アイテムで、送信失敗時はリトライします。
+resource "aws_dynamodb_table" "notification_outbox" {
+  name         = "${local.name_prefix}-notification-outbox"
+  billing_mode = "PAY_PER_REQUEST"
+  hash_key     = "outboxKey"  # パーティションキー: "路線ID#メッセージのハッシュ"
+  range_key    = "lineUserId" # ソートキー: 通知先のユーザー
+
+  attribute {
+    name = "outboxKey"
+    type = "S"
+  }
+  attribute {
+    name = "lineUserId"
+    type = "S"
+  }
+  attribute {
+    name = "deliveryStatus"
+    type = "S"
+  }
+  attribute {
+    name = "nextAttemptAt"
+    type = "N"
+  }
+
+  # 未配信 (PENDING) かつ送信予定時刻を過ぎたアイテムを取得するためのGSI
+  # 配信済み・失敗したアイテムはnextAttemptAtを削除するため、インデックスには未配信のアイテムのみが残る
+  global_secondary_index {
+    name            = "pending-index"
+    hash_key        = "deliveryStatus"
+    range_key       = "nextAttemptAt"
+    projection_type = "ALL"
+  }
+
+  # 配信済み・失敗したアイテムは一定期間後に自動削除
+  ttl {
+    enabled        = true
+    attribute_name = "ttl"
+  }
+
+  server_side_encryption {
+    enabled = true
+  }
+
+  tags = merge(local.tags, {
+    Name = "${local.name_prefix}-notification-outbox"
+  })
+}
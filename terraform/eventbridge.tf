@@ -41,3 +41,35 @@ resource "aws_lambda_permission" "allow_eventbridge" {
   principal     = "events.amazonaws.com"
   source_arn    = aws_cloudwatch_event_rule.check_delay_rule.arn
 }
+
+# -----------------------------------------------------------------------------
+# Outbox Delivery Rule
+# -----------------------------------------------------------------------------
+# アウトボックスの再送待ちの通知を配信するため、1分ごとに配信処理のみを実行するルール
+# (遅延チェックは1時間ごとのため、再送のバックオフ (30秒, 60秒, ...) をこのルールで処理する)
+resource "aws_cloudwatch_event_rule" "deliver_outbox_rule" {
+  name                = "${local.name_prefix}-deliver-outbox-rule"
+  description         = "1分ごとにアウトボックスの未配信通知を送信するLambdaをトリガーします。"
+  schedule_expression = "rate(1 minute)"
+
+  state = "ENABLED"
+
+  tags = merge(local.tags, {
+    Name = "${local.name_prefix}-deliver-outbox-rule"
+  })
+}
+
+resource "aws_cloudwatch_event_target" "deliver_outbox_target" {
+  rule      = aws_cloudwatch_event_rule.deliver_outbox_rule.name
+  target_id = "${local.name_prefix}-deliver-outbox-lambda"
+  arn       = aws_lambda_function.check_delay_lambda.arn
+  input     = jsonencode({ action = "deliver" })
+}
+
+resource "aws_lambda_permission" "allow_eventbridge_deliver_outbox" {
+  statement_id  = "AllowExecutionFromEventBridgeDeliverOutbox"
+  action        = "lambda:InvokeFunction"
+  function_name = aws_lambda_function.check_delay_lambda.function_name
+  principal     = "events.amazonaws.com"
+  source_arn    = aws_cloudwatch_event_rule.deliver_outbox_rule.arn
+}
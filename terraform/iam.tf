@@ -66,3 +66,10 @@ resource "aws_iam_role_policy_attachment" "lambda_policy_sns" {
   role       = aws_iam_role.lambda_exec_role.name
   policy_arn = "arn:aws:iam::aws:policy/AmazonSNSFullAccess"
 }
+
+# SQSへのアクセスを許可するポリシー
+# 管理者向け通知のキューへの送信と、イベントソースマッピングによる受信に使用します。
+resource "aws_iam_role_policy_attachment" "lambda_policy_sqs" {
+  role       = aws_iam_role.lambda_exec_role.name
+  policy_arn = "arn:aws:iam::aws:policy/AmazonSQSFullAccess"
+}
@@ -45,10 +45,12 @@ resource "aws_lambda_function" "user_settings_lambda" {
       LINE_CHANNEL_ID                = var.line_login_channel_id
       LINE_CHANNEL_SECRET_PARAM_NAME = aws_ssm_parameter.line_channel_secret.name
       USER_TABLE_NAME                = aws_dynamodb_table.users.name
+      ROUTE_SUBSCRIBERS_TABLE_NAME   = aws_dynamodb_table.route_subscribers.name
       FRONTEND_REDIRECT_URL          = var.frontend_redirect_url
       FRONTEND_ORIGIN                = var.frontend_origin
       S3_OUTPUT_BUCKET               = aws_s3_bucket.s3_train_alert.id
       SNS_TOPIC_ARN                  = aws_sns_topic.sns_topic_system.arn
+      ADMIN_NOTIFY_QUEUE_URL         = aws_sqs_queue.admin_notify_queue.url
     }
   }
 
@@ -99,8 +101,16 @@ resource "aws_lambda_function" "check_delay_lambda" {
       S3_OUTPUT_BUCKET                  = aws_s3_bucket.s3_train_alert.id
       TRAIN_STATUS_TABLE_NAME           = aws_dynamodb_table.train_status.name
       USER_TABLE_NAME                   = aws_dynamodb_table.users.name
+      ROUTE_SUBSCRIBERS_TABLE_NAME      = aws_dynamodb_table.route_subscribers.name
+      OUTBOX_TABLE_NAME                 = aws_dynamodb_table.notification_outbox.name
       NG_WORD                           = var.ng_word[0]
       RESPONSE_TIMEOUT                  = max(var.response_timeout, 55)
+      # 遅延チェックのシャード数 (送信はアウトボックス経由で、判定処理はCPU処理のみとなり、
+      # スレッドでは速くならず、Lambdaではプロセスプールも使えないため、単一ループで処理する。
+      # 1 vCPUでの計測はスレッド x1.05、プロセス x0.79 で、マルチコアでの高速化は未確認)
+      DELAY_CHECK_SHARDS                = 1
+      DELAY_CHECK_EXECUTOR              = "thread"
+      ENDPOINT_HEALTH_PERSIST           = "true" # 運行情報APIのサーキット状態をS3に保存し、コールドスタート後も引き継ぐ
     }
   }
 
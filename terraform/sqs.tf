@@ -0,0 +1,49 @@
+# =============================================================================
+# SQS (Simple Queue Service)
+# =============================================================================
+# 管理者向けのユーザー登録通知を永続的にバッファリングするキューを定義します。
+# user_settings_lambdaが保存ごとにメッセージを送信し、一定件数または一定時間ごとに
+# まとめて受け取ったメッセージを、1通のダイジェストとしてSNSに発行します。
+
+# -----------------------------------------------------------------------------
+# SQS Queue
+# -----------------------------------------------------------------------------
+# 管理者通知のキュー
+resource "aws_sqs_queue" "admin_notify_queue" {
+  name = "${local.name_prefix}-admin-notify-queue"
+  # 可視性タイムアウトは、Lambdaのタイムアウトの6倍以上を推奨
+  visibility_timeout_seconds = var.lambda_timeout_seconds * 6
+  message_retention_seconds  = 4 * 24 * 60 * 60 # 4日間
+
+  # 発行に繰り返し失敗したメッセージはデッドレターキューに移動する
+  redrive_policy = jsonencode({
+    deadLetterTargetArn = aws_sqs_queue.admin_notify_dlq.arn
+    maxReceiveCount     = 5
+  })
+
+  tags = merge(local.tags, {
+    Name = "${local.name_prefix}-admin-notify-queue"
+  })
+}
+
+# 管理者通知のデッドレターキュー
+resource "aws_sqs_queue" "admin_notify_dlq" {
+  name                      = "${local.name_prefix}-admin-notify-dlq"
+  message_retention_seconds = 14 * 24 * 60 * 60 # 14日間
+
+  tags = merge(local.tags, {
+    Name = "${local.name_prefix}-admin-notify-dlq"
+  })
+}
+
+# -----------------------------------------------------------------------------
+# Event Source Mapping
+# -----------------------------------------------------------------------------
+# キューのメッセージをまとめてuser_settings_lambdaに渡す
+resource "aws_lambda_event_source_mapping" "admin_notify_mapping" {
+  event_source_arn = aws_sqs_queue.admin_notify_queue.arn
+  function_name    = aws_lambda_function.user_settings_lambda.arn
+  # 20件たまるか、最初のメッセージから300秒経過した時点でまとめて呼び出す
+  batch_size                         = 20
+  maximum_batching_window_in_seconds = 300
+}